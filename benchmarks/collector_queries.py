@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare DataCollector's indexed queries against linear scans
+
+Run from the project root:
+    python benchmarks/collector_queries.py [stations] [days]
+
+The defaults collect 2,000,000 readings (5,000 stations for 400 days).
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simpy
+import weather
+
+
+def build_collector(stations, days):
+    collector = weather.DataCollector(simpy.Environment(), msg_queue=None)
+    names = ['ST{:05d}'.format(i) for i in range(stations)]
+    for day in range(days):
+        for name in names:
+            collector.put(weather.WeatherReading(
+                              name, -30.0, 140.0, 10.0, day,
+                              weather.WeatherCondition.Sunny,
+                              20.0, 1000.0, 50.0))
+    return collector, names
+
+
+def linear_between(data, station, start, end):
+    return [r for r in data
+            if r.station == station and start <= r.local_time < end]
+
+
+def linear_latest(data, station):
+    latest = None
+    for r in data:
+        if r.station == station and (latest is None or
+                                     r.local_time >= latest.local_time):
+            latest = r
+    return latest
+
+
+def linear_on_day(data, day):
+    return [r for r in data if day <= r.local_time < day + 1]
+
+
+def report(name, indexed, linear, repeats):
+    indexed_s = min(timeit.repeat(indexed, number=repeats, repeat=3)) / repeats
+    linear_s = min(timeit.repeat(linear, number=1, repeat=3))
+    print('{:<22} indexed {:10.2f} us  linear {:10.2f} ms  speedup {:>9.0f}x'
+          .format(name, indexed_s * 1e6, linear_s * 1e3, linear_s / indexed_s))
+
+
+def main():
+    stations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    collector, names = build_collector(stations, days)
+    data = collector.data
+    print('{} readings from {} stations over {} days'.format(
+        len(data), stations, days))
+
+    station = random.choice(names)
+    start, end = days // 4, days // 2
+    assert (collector.readings_between(station, start, end) ==
+            linear_between(data, station, start, end))
+    assert collector.latest_reading(station) == linear_latest(data, station)
+    assert collector.readings_on_day(start) == linear_on_day(data, start)
+
+    report('range (station, days)',
+           lambda: collector.readings_between(station, start, end),
+           lambda: linear_between(data, station, start, end),
+           repeats=1000)
+    report('latest reading',
+           lambda: collector.latest_reading(station),
+           lambda: linear_latest(data, station),
+           repeats=10000)
+    report('day cross-section',
+           lambda: collector.readings_on_day(start),
+           lambda: linear_on_day(data, start),
+           repeats=100)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compression ratio and encode/decode throughput of the compressed
+collector backend on a full year run
+
+Run from the project root:
+    python benchmarks/compression.py [stations] [days]
+"""
+
+import os
+import pickle
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run_sim
+import simpy
+from weather import compression, core, helpers, measurements
+
+
+class FakeEnv(object):
+    now = 0
+
+
+def simulate(stations, days):
+    """Readings of a year run in collection order, without simpy overhead"""
+    environment = FakeEnv()
+    rng = random.Random(0)
+    states = []
+    for i in range(stations):
+        hottest_day = rng.randrange(365)
+        low_temp = rng.uniform(-10, 15)
+        altitude = float(rng.randrange(0, 1500))
+        transformer = helpers.build_fused_transformer(environment,
+                                                      hottest_day,
+                                                      low_temp,
+                                                      low_temp + 20,
+                                                      altitude,
+                                                      run_sim.TEMPERATURE_SIGMA,
+                                                      run_sim.PRESSURE_SIGMA)
+        reading = measurements.WeatherReading(
+                        'ST{:04d}'.format(i), rng.uniform(-45, -10),
+                        rng.uniform(110, 155), altitude, 0,
+                        measurements.WeatherCondition.Sunny,
+                        low_temp, helpers.pressure(altitude), 50.0)
+        states.append([transformer, reading])
+    readings = []
+    for day in range(days):
+        environment.now = day
+        for state in states:
+            state[1] = state[0](state[1])
+            readings.append(state[1])
+    return readings
+
+
+def main():
+    stations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    readings = simulate(stations, days)
+    print('{} readings from {} stations over {} days'.format(
+        len(readings), stations, days))
+
+    collector = compression.CompressedCollector(simpy.Environment(), None)
+    start = time.perf_counter()
+    for reading in readings:
+        collector.put(reading)
+    encode_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = 0
+    for _ in collector:
+        decoded += 1
+    decode_s = time.perf_counter() - start
+    assert decoded == len(readings)
+
+    boxed = len(readings) * core.estimate_record_size(readings[0])
+    pickled = len(pickle.dumps(readings, pickle.HIGHEST_PROTOCOL))
+    footprint = collector.footprint
+    print('boxed readings  {:10.1f} MB'.format(boxed / 1e6))
+    print('pickled         {:10.1f} MB'.format(pickled / 1e6))
+    print('compressed      {:10.1f} MB  ({:.1f} bytes per reading)'.format(
+        footprint / 1e6, footprint / float(len(readings))))
+    print('ratio           {:10.1f}x vs boxed, {:.1f}x vs pickled'.format(
+        boxed / float(footprint), pickled / float(footprint)))
+    print('encode          {:10.0f} readings/s'.format(len(readings) / encode_s))
+    print('decode          {:10.0f} readings/s'.format(len(readings) / decode_s))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure the startup cost of run_sim against budgets
+
+Run from the project root:
+    python benchmarks/import_time.py [budget_ms] [engine_budget_ms] [run_budget_ms]
+
+Exits non-zero when one of these medians exceeds its budget:
+    - the cumulative import time of run_sim, as reported by
+      `python -X importtime`
+    - the cumulative import time of run_sim together with the simulation
+      engine (weather.core), which every run imports
+    - the wall clock time of a full 1 day run in a fresh interpreter
+"""
+
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DEFAULT_BUDGET_MS = 30
+DEFAULT_ENGINE_BUDGET_MS = 120
+DEFAULT_RUN_BUDGET_MS = 250
+REPEATS = 7
+
+RUN_ONE_DAY = ("import run_sim; "
+               "run_sim.run(run_sim.override_config(run_sim.get_config(), "
+               "{{'runtime': 1, 'output_file': {!r}}}))")
+
+
+def import_time_us(*modules):
+    """Cumulative import time of `import <modules>` in microseconds,
+    summed over the modules that were not already imported by another"""
+    result = subprocess.run([sys.executable, '-X', 'importtime',
+                             '-c', 'import ' + ', '.join(modules)],
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    pattern = re.compile(r'\|\s*(\d+)\s*\| (\S+)$')
+    times = [int(match.group(1)) for match in
+             map(pattern.search, result.stderr.splitlines())
+             if match and match.group(2) in modules]
+    if not times:
+        raise RuntimeError('no import time reported for ' + ', '.join(modules))
+    return sum(times)
+
+
+def run_time_us(output_file):
+    """Wall clock time of a 1 day run in a new interpreter in microseconds"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', RUN_ONE_DAY.format(output_file)],
+                   stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL,
+                   check=True)
+    return (time.perf_counter() - start) * 1e6
+
+
+def report(name, timings_us):
+    """Print the median and minimum of timings, returning the median in ms"""
+    timings = [t / 1000.0 for t in timings_us]
+    median = statistics.median(timings)
+    print('{:<22} median {:7.2f} ms  min {:7.2f} ms'.format(
+        name, median, min(timings)))
+    return median
+
+
+def main():
+    budgets = [DEFAULT_BUDGET_MS, DEFAULT_ENGINE_BUDGET_MS,
+               DEFAULT_RUN_BUDGET_MS]
+    for i, arg in enumerate(sys.argv[1:len(budgets) + 1]):
+        budgets[i] = float(arg)
+    for module in ['weather', 'weather.core']:
+        report(module, [import_time_us(module) for _ in range(REPEATS)])
+    medians = [
+        report('run_sim',
+               [import_time_us('run_sim') for _ in range(REPEATS)]),
+        report('run_sim, weather.core',
+               [import_time_us('run_sim', 'weather.core')
+                for _ in range(REPEATS)])]
+    with tempfile.TemporaryDirectory() as directory:
+        output_file = os.path.join(directory, 'output.csv')
+        medians.append(report('1 day run',
+                              [run_time_us(output_file)
+                               for _ in range(REPEATS)]))
+    failed = False
+    names = ['run_sim import', 'run_sim and engine import', '1 day run']
+    for name, median, budget in zip(names, medians, budgets):
+        if median > budget:
+            print('{} time {:.2f} ms exceeds budget of {:.2f} ms'
+                  .format(name, median, budget))
+            failed = True
+        else:
+            print('{} within budget of {:.2f} ms'.format(name, budget))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the per-reading cost of the composed and fused transformers
+
+Run from the project root:
+    python benchmarks/transformer.py [readings]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run_sim
+from weather import helpers, measurements
+
+
+class FakeEnv(object):
+    now = 100
+
+
+def composed_transformer(environment, record):
+    """The transformer run_sim builds for pluggable updaters"""
+    return helpers.build_transformer(
+                environment,
+                helpers.weather_condition,
+                helpers.build_temperature_updater(run_sim.temperature_variation,
+                                                  record['hottest_day'],
+                                                  record['low_temp'],
+                                                  record['high_temp']),
+                run_sim.compose(run_sim.pressure_variation, helpers.pressure),
+                helpers.humidity_updater)
+
+
+def fused_transformer(environment, record):
+    return helpers.build_fused_transformer(environment,
+                                           record['hottest_day'],
+                                           record['low_temp'],
+                                           record['high_temp'],
+                                           record['altitude'],
+                                           run_sim.TEMPERATURE_SIGMA,
+                                           run_sim.PRESSURE_SIGMA)
+
+
+def main():
+    readings = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    record = {'hottest_day': 0, 'low_temp': 7, 'high_temp': 21,
+              'altitude': 575}
+    reading = measurements.WeatherReading('CBR', -35.28, 149.13, 575, 0,
+                                          measurements.WeatherCondition.Sunny,
+                                          14, 950, 50)
+    environment = FakeEnv()
+    results = {}
+    for name, build in [('composed', composed_transformer),
+                        ('fused', fused_transformer)]:
+        transformer = build(environment, record)
+        seconds = min(timeit.repeat(lambda: transformer(reading),
+                                    number=readings, repeat=5))
+        results[name] = seconds / readings
+        print('{:<9} {:7.3f} us per reading'.format(name, results[name] * 1e6))
+    print('speedup   {:7.2f}x'.format(results['composed'] / results['fused']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,224 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from configparser import SafeConfigParser
+# Keep module level imports lean: this script is launched thousands of times
+# for tiny runs, so the simulation engine (simpy) and anything only needed by
+# the server mode are imported where they are used.
 import functools
+import math
 import random
-import simpy
+import sys
 import weather
 
 from weather import helpers
 
-def get_config():
+DEFAULT_CONFIG_FILE = 'config.ini'
+
+
+def get_config(config_file=DEFAULT_CONFIG_FILE):
     """Get the default config
 
+    Args:
+        config_file (string): path to the configuration file
+
     Returns:
-        (SafeConfigParser): the configuration
+        (ConfigParser): the configuration
     """
-    parser = SafeConfigParser()
-    parser.read('config.ini')
+    from configparser import ConfigParser
+    parser = ConfigParser()
+    parser.read(config_file)
     return parser
 
 
-def build_sim_with_collector_and_screen_printer(config):
+def build_sim_with_collector_and_screen_printer(config, subscribers=()):
     """Construct the simulation with:
         - a data collector
         - a screen printer that emits records to standard out
+        - any further subscribers
 
     Args:
-        config (SafeConfigParser): the configuration
+        config (ConfigParser): the configuration
+        subscribers (list): see build_simulation
 
     Returns (Simpy.Environment, DataCollector)
     """
+    environment, data_collector, _ = build_simulation(config, subscribers)
+    return environment, data_collector
+
+
+def build_simulation(config, subscribers=()):
+    """Construct the simulation, see build_sim_with_collector_and_screen_printer
+
+    With 'threaded_subscribers' enabled the data collector, the screen
+    printer and subscribers run on worker threads fed through ring buffers
+    of 'ring_buffer_size' records, rather than as simpy processes. Close the
+    broadcast pipe after the run to drain them before using the collector.
+
+    Args:
+        config (ConfigParser): the configuration
+        subscribers (list): objects with a put(record) method and a
+            run(queue) method returning a simpy process consuming the queue
+
+    Returns (Simpy.Environment, DataCollector, BroadcastPipe)
+    """
+    import simpy
     environment = simpy.Environment()
     broadcast_queue = weather.BroadcastPipe(environment)
-    attach_stations(config.get('options', 'stations'),
-                    environment,
-                    broadcast_queue)
-    data_collector = weather.DataCollector(environment,
-                                           broadcast_queue.get_output_conn())
-    environment.process(screen_printer(environment,
-                                       broadcast_queue.get_output_conn()))
-    return environment, data_collector
+    stations = attach_stations(config.get('options', 'stations'),
+                               environment,
+                               broadcast_queue,
+                               get_region(config),
+                               get_variation_builders(config, environment),
+                               get_station_builder(config))
+    memory_limit = get_memory_limit(config)
+    threaded = config.getboolean('options', 'threaded_subscribers',
+                                 fallback=False)
+    data_collector = build_collector(
+                        config,
+                        environment,
+                        None if threaded else broadcast_queue.get_output_conn(),
+                        memory_limit)
+    if isinstance(data_collector, weather.DataCollector):
+        report_memory_estimate(len(stations),
+                               config.getint('options', 'runtime'),
+                               every_day_schedule,
+                               memory_limit,
+                               get_ensemble(config))
+    if threaded:
+        # The collector may spill to disk, keep that off the simulation too
+        broadcast_queue.subscribe(data_collector.put,
+                                  get_ring_buffer_size(config),
+                                  name=type(data_collector).__name__)
+        broadcast_queue.subscribe(print,
+                                  get_ring_buffer_size(config),
+                                  name='screen_printer')
+    else:
+        environment.process(screen_printer(environment,
+                                           broadcast_queue.get_output_conn()))
+    for subscriber in subscribers:
+        attach_subscriber(config, environment, broadcast_queue, subscriber)
+    return environment, data_collector, broadcast_queue
+
+
+def attach_subscriber(config, environment, broadcast_queue, subscriber):
+    """Feed the records of the broadcast pipe to subscriber, on a worker
+    thread with 'threaded_subscribers' enabled, otherwise as a simpy process
+
+    Args:
+        config (ConfigParser): the configuration
+        environment (simpy.Environment)
+        broadcast_queue (BroadcastPipe)
+        subscriber: object with a put(record) method and a run(queue)
+            method returning a simpy process consuming the queue
+    """
+    if config.getboolean('options', 'threaded_subscribers', fallback=False):
+        broadcast_queue.subscribe(subscriber.put,
+                                  get_ring_buffer_size(config),
+                                  name=type(subscriber).__name__)
+    else:
+        environment.process(subscriber.run(broadcast_queue.get_output_conn()))
+
+
+def get_ring_buffer_size(config):
+    """Records buffered per threaded subscriber, see BroadcastPipe.subscribe"""
+    return config.getint('options', 'ring_buffer_size', fallback=65536)
+
+
+def build_collector(config, environment, msg_queue, memory_limit=None):
+    """Build the data collector selected by 'collector_backend':
+    'memory' for a DataCollector, 'compressed' for a CompressedCollector,
+    which does not support memory_limit or the time and region queries.
+    Raises ValueError for options the backend does not support.
+
+    Args:
+        config (ConfigParser): the configuration
+        environment (simpy.Environment)
+        msg_queue (simpy.Store): the queue to collect from, None if the
+            caller feeds the collector through put
+        memory_limit (int): see DataCollector
+
+    Returns:
+        (DataCollector or CompressedCollector)
+    """
+    backend = config.get('options', 'collector_backend', fallback='memory')
+    if backend == 'memory':
+        return weather.DataCollector(environment, msg_queue, memory_limit)
+    if backend == 'compressed':
+        if get_ensemble(config) is not None:
+            raise ValueError('The compressed collector only holds readings, '
+                             'not ensemble summaries')
+        if memory_limit is not None:
+            raise ValueError('The compressed collector does not spill to '
+                             'disk, memory_limit_mb needs the memory backend')
+        from weather import compression
+        return compression.CompressedCollector(environment, msg_queue)
+    raise ValueError('Unknown collector_backend {!r}'.format(backend))
+
+
+def get_memory_limit(config):
+    """Get the memory ceiling for collected readings
+
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (int): bytes, None if 'memory_limit_mb' is not set
+    """
+    limit_mb = config.getfloat('options', 'memory_limit_mb', fallback=None)
+    if limit_mb is None:
+        return None
+    return int(limit_mb * 1024 * 1024)
+
+
+def estimate_memory(number_of_stations, runtime, schedule, ensemble=None):
+    """Estimate the memory needed to collect all readings of a run
+
+    Args:
+        number_of_stations (int)
+        runtime (int): days
+        schedule (function: -> double): the station schedule
+        ensemble ((int, list[double])): see get_ensemble, the readings
+            are EnsembleSummary records if set
+
+    Returns:
+        (int, int): number of readings and bytes, including the index
+    """
+    from weather import core
+    readings = number_of_stations * int(math.ceil(runtime / schedule()))
+    if ensemble is None:
+        sample = weather.WeatherReading('SYD', -33.86, 151.12, 10.0, 0,
+                                        weather.WeatherCondition.Sunny,
+                                        19.0, 1014.0, 78.0)
+    else:
+        from weather import ensemble as ensembles
+        members, percentiles = ensemble
+        sample = ensembles.EnsembleSummary(
+                    'SYD', -33.86, 151.12, 10.0, 0, members,
+                    tuple(19.0 + q for q in percentiles),
+                    tuple(1014.0 + q for q in percentiles),
+                    tuple(78.0 + q for q in percentiles),
+                    tuple(1.0 / len(weather.WeatherCondition)
+                          for _ in weather.WeatherCondition))
+    per_reading = core.estimate_record_size(sample) + core.INDEX_ENTRY_SIZE
+    return readings, readings * per_reading
+
+
+def report_memory_estimate(number_of_stations, runtime, schedule, memory_limit,
+                           ensemble=None):
+    """Print the expected memory use of the collector to standard error"""
+    readings, size = estimate_memory(number_of_stations, runtime, schedule,
+                                     ensemble)
+    message = 'Collecting ~{} readings from {} stations needs ~{:.1f} MB'.format(
+                    readings, number_of_stations, size / (1024.0 * 1024.0))
+    if memory_limit is not None and size > memory_limit:
+        from weather import core
+        index_size = readings * core.INDEX_ENTRY_SIZE
+        message += ', over the {:.1f} MB limit: older readings will be ' \
+                   'spilled to disk'.format(memory_limit / (1024.0 * 1024.0))
+        if index_size > memory_limit:
+            message += ', but their index alone needs ~{:.1f} MB and ' \
+                       'stays in memory'.format(index_size / (1024.0 * 1024.0))
+    print(message, file=sys.stderr)
 
 
 def screen_printer(environment, queue):
@@ -54,44 +233,216 @@ def screen_printer(environment, queue):
         print(msg)
 
 
-def attach_stations(stations_file, environment, broadcast_queue):
+def get_region(config):
+    """Get the region to restrict the simulation to, if configured
+
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (BoundingBox or Circle or None)
+    """
+    from weather import spatial
+    return spatial.parse_region(
+                bbox=config.get('options', 'region_bbox', fallback=None),
+                center=config.get('options', 'region_center', fallback=None),
+                radius_km=config.get('options', 'region_radius_km',
+                                     fallback=None))
+
+
+def get_variation_builders(config, environment):
+    """Get the builders of per station temperature and pressure variation
+
+    With 'correlated_fields' enabled the variation of every station is drawn
+    from temperature and pressure fields shared between all stations, on a
+    grid with a spacing of 'field_resolution' degrees.
+
+    Args:
+        config (ConfigParser): the configuration
+        environment (simpy.Environment)
+
+    Returns:
+        ((function (dict) -> (function (double) -> double)) * 2 or None):
+            builders taking a stations_file record,
+            None for independent variation per station
+    """
+    if not config.getboolean('options', 'correlated_fields', fallback=False):
+        return None
+    from weather import fields
+    resolution = config.getfloat('options', 'field_resolution', fallback=5.0)
+    temperature_field = fields.SharedField(environment, resolution)
+    pressure_field = fields.SharedField(environment, resolution)
+
+    def builder(field, sigma):
+        def build(record):
+            return fields.build_variation(field,
+                                          float(record['latitude']),
+                                          float(record['longitude']),
+                                          sigma)
+        return build
+
+    return (builder(temperature_field, TEMPERATURE_SIGMA),
+            builder(pressure_field, PRESSURE_SIGMA))
+
+
+def attach_stations(stations_file,
+                    environment,
+                    broadcast_queue,
+                    region=None,
+                    variation_builders=None,
+                    station_builder=None):
     """Build and attach the weather stations to the environment
 
     Args:
         stations_file (string): path to file
         environment(simpy.Environment)
         broadcast_queue (BroadcastPipe): the message queue
+        region (BoundingBox or Circle): only attach stations within region,
+            all stations if None
+        variation_builders ((function (dict) -> function) * 2):
+            build the temperature and pressure variation of a station,
+            see get_variation_builders. Independent variation if None
+        station_builder (function): builds and attaches a station,
+            defaults to build_and_attach_station
+
+    Returns:
+        (list): the attached stations
     """
     records = helpers.read_csv_file(stations_file)
+    if region is not None:
+        from weather import spatial
+        index = spatial.index_records(records)
+        records = [records[i] for i in sorted(index.query(region))]
+    station_builder = station_builder or build_and_attach_station
+    stations = []
     for rec in records:
-        build_and_attach_station(rec,
-                                 environment,
-                                 every_day_schedule,
-                                 broadcast_queue)
+        variations = None
+        if variation_builders is not None:
+            variations = [build(rec) for build in variation_builders]
+        stations.append(station_builder(rec,
+                                        environment,
+                                        every_day_schedule,
+                                        broadcast_queue,
+                                        variations))
+    return stations
 
 
-def build_and_attach_station(record, environment, schedule, msg_queue):
-    """Build and attach the weather station to the environment
+def get_ensemble(config):
+    """Get the ensemble settings, if configured
+
+    With 'ensemble_members' set above 0 every station simulates that many
+    members at once and emits per tick summaries at 'ensemble_percentiles'
+    instead of single readings.
+
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (int, list[double]): number of members and percentiles,
+            None if ensembles are not enabled
+    """
+    members = config.getint('options', 'ensemble_members', fallback=0)
+    if members <= 0:
+        return None
+    percentiles = config.get('options', 'ensemble_percentiles',
+                             fallback='5, 50, 95')
+    return members, [float(q) for q in percentiles.split(',')]
+
+
+def get_station_builder(config):
+    """Get the function building and attaching a station
+
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (function): see build_and_attach_station
+    """
+    ensemble = get_ensemble(config)
+    if ensemble is None:
+        return build_and_attach_station
+    members, percentiles = ensemble
+    return functools.partial(build_and_attach_ensemble_station,
+                             members=members,
+                             percentiles=percentiles)
+
+
+def build_and_attach_ensemble_station(record,
+                                      environment,
+                                      schedule,
+                                      msg_queue,
+                                      variations=None,
+                                      members=100,
+                                      percentiles=(5, 50, 95)):
+    """Build and attach a weather station simulating an ensemble
 
     Args:
         record (dict): a line from the stations_file
         environment(simpy.Environment)
         msg_queue (BroadcastPipe): the message queue
+        variations: not supported, ensemble members vary independently
+        members (int): number of ensemble members
+        percentiles (list[double]): percentiles to summarise, 0...100
     """
+    if variations is not None:
+        raise ValueError('Ensembles do not support correlated_fields')
+    from weather import ensemble
+    weather_state = ensemble.build_ensemble(environment,
+                                            record,
+                                            members,
+                                            percentiles,
+                                            TEMPERATURE_SIGMA,
+                                            PRESSURE_SIGMA)
+    station = weather.weather_station(environment,
+                                      weather_state,
+                                      schedule,
+                                      msg_queue)
+    environment.process(station)
+    return station
 
+
+def build_and_attach_station(record,
+                             environment,
+                             schedule,
+                             msg_queue,
+                             variations=None):
+    """Build and attach the weather station to the environment
+
+    Args:
+        record (dict): a line from the stations_file
+        environment(simpy.Environment)
+        msg_queue (BroadcastPipe): the message queue
+        variations ((function (double) -> double) * 2):
+            the temperature and pressure variation, defaults to
+            temperature_variation and pressure_variation, for which
+            a fused transformer is used
+    """
+    t_variation, p_variation = variations or (temperature_variation,
+                                              pressure_variation)
     conditions_updater = helpers.weather_condition
     temperature_updater = helpers.build_temperature_updater(
-                                                temperature_variation,
+                                                t_variation,
                                                 float(record['hottest_day']),
                                                 float(record['low_temp']),
                                                 float(record['high_temp']))
-    pressure_updater = compose(pressure_variation, helpers.pressure)
+    pressure_updater = compose(p_variation, helpers.pressure)
     humidity_updater = helpers.humidity_updater
-    transformer = helpers.build_transformer(environment,
-                                            conditions_updater,
-                                            temperature_updater,
-                                            pressure_updater,
-                                            humidity_updater)
+    if variations is None:
+        # The default updaters, fused into a single specialised function
+        transformer = helpers.build_fused_transformer(
+                                                environment,
+                                                float(record['hottest_day']),
+                                                float(record['low_temp']),
+                                                float(record['high_temp']),
+                                                float(record['altitude']),
+                                                TEMPERATURE_SIGMA,
+                                                PRESSURE_SIGMA)
+    else:
+        transformer = helpers.build_transformer(environment,
+                                                conditions_updater,
+                                                temperature_updater,
+                                                pressure_updater,
+                                                humidity_updater)
 
     def to_weather_reading(record):
         temperature = temperature_updater(environment.now)
@@ -126,6 +477,10 @@ def every_day_schedule():
     return 1
 
 
+TEMPERATURE_SIGMA = 0.15
+PRESSURE_SIGMA = 0.02
+
+
 def temperature_variation(temperature):
     """Introduce some random variation
     Args:
@@ -134,7 +489,7 @@ def temperature_variation(temperature):
     Returns:
         (double)
     """
-    return temperature * random.gauss(mu=1, sigma=0.15)
+    return temperature * random.gauss(mu=1, sigma=TEMPERATURE_SIGMA)
 
 
 def pressure_variation(pressure):
@@ -145,31 +500,239 @@ def pressure_variation(pressure):
     Returns:
         (double)
     """
-    return pressure * random.gauss(mu=1, sigma=0.02)
+    return pressure * random.gauss(mu=1, sigma=PRESSURE_SIGMA)
 
 
 def compose(f, g):
     return lambda x: f(g(x))
 
 
-def write_to_file(output_file, data):
+"""Turn a WeatherReading into a line of the output file"""
+report_line = functools.partial(helpers.weather_reading_to_report_line, sep='|')
+
+
+def get_line_processor(config):
+    """Get the function turning a record into a line of the output file
+
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (function (WeatherReading or EnsembleSummary) -> string)
+    """
+    if get_ensemble(config) is None:
+        return report_line
+    from weather import ensemble
+    return functools.partial(ensemble.ensemble_summary_to_report_line, sep='|')
+
+
+def build_output_writer(config):
+    """Build the writer streaming the output during the run, if configured
+
+    With 'output_format = chunked' the output is written while the simulation
+    runs as independently compressed chunks ('output_codec', one of
+    gzip, bz2 or lzma) of 'chunk_readings' readings, compressed by
+    'compression_workers' threads, with an index next to the output file.
+
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (ChunkedWriter): None for the plain output written after the run
+    """
+    output_format = config.get('options', 'output_format', fallback='plain')
+    if output_format == 'plain':
+        return None
+    if output_format != 'chunked':
+        raise ValueError('Unknown output_format {!r}'.format(output_format))
+    from weather import chunked
+    return chunked.ChunkedWriter(
+                config.get('options', 'output_file'),
+                get_line_processor(config),
+                chunk_size=config.getint('options', 'chunk_readings',
+                                         fallback=10000),
+                codec=config.get('options', 'output_codec', fallback='gzip'),
+                workers=config.getint('options', 'compression_workers',
+                                      fallback=4))
+
+
+def build_rollup_writer(config):
+    """Build the writer of aggregates per station, if configured
+
+    'rollups' lists the tiers to maintain during the run (daily, monthly,
+    yearly), each written to its own file next to the output file.
+
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (RollupWriter): None if no tiers are configured
+    """
+    tiers = [tier.strip()
+             for tier in config.get('options', 'rollups', fallback='').split(',')
+             if tier.strip()]
+    if not tiers:
+        return None
+    if get_ensemble(config) is not None:
+        raise ValueError('Rollups aggregate readings, not ensemble summaries')
+    from weather import rollups
+    return rollups.RollupWriter(config.get('options', 'output_file'), tiers)
+
+
+def write_to_file(output_file, data, line_processor=report_line):
     """Write the data to file
 
     Args:
         output_file (string): output file for data
-        data (list[WeatherReading]): simulation data
+        data (iterable[WeatherReading]): simulation data,
+            e.g. a DataCollector, which loads spilled readings lazily
+        line_processor (function WeatherReading -> string):
+            turns a record into a line, see get_line_processor
     """
-    line_proc = functools.partial(
-                    helpers.weather_reading_to_report_line, sep='|')
-    helpers.write_data(data, output_file, line_proc)
+    helpers.write_data(data, output_file, line_processor)
+
+
+def run(config):
+    """Run a single simulation and write its output
 
+    Args:
+        config (ConfigParser): the configuration
+
+    Returns:
+        (DataCollector): the collector holding the simulation data
+    """
+    import contextlib
+    simulation, data_collector, broadcast_queue = build_simulation(config)
+    # Only open the outputs once the simulation is built, so a bad
+    # configuration leaves previous outputs untouched, and always close them
+    with contextlib.ExitStack() as writers:
+        try:
+            writer = build_output_writer(config)
+            for subscriber in [writer, build_rollup_writer(config)]:
+                if subscriber is not None:
+                    attach_subscriber(config,
+                                      simulation,
+                                      broadcast_queue,
+                                      writers.enter_context(subscriber))
+            simulation.run(until=config.getint('options', 'runtime'))
+        finally:
+            # Drain the threaded subscribers before anything is closed
+            for metrics in broadcast_queue.close():
+                print('{name}: {published} records, max lag {max_lag}, '
+                      'waited on a full buffer {producer_waits} times'
+                      .format(**metrics), file=sys.stderr)
+    if writer is None:
+        write_to_file(config.get('options', 'output_file'),
+                      data_collector,
+                      get_line_processor(config))
+    return data_collector
+
+
+def build_server(socket_path, config):
+    """Build a server that runs simulations on request over a unix socket
+
+    Every request is a single line of JSON holding overrides for the
+    'options' section of the configuration, e.g. {"runtime": 10}.
+    Every response is a single line of JSON with a 'status' of
+    'ok' or 'error'. The interpreter, simpy and the weather package stay
+    loaded between requests so tiny runs do not pay the startup cost.
 
-def main():
-    config = get_config()
-    simulation, data_collector = build_sim_with_collector_and_screen_printer(
-                                                                        config)
-    simulation.run(until=config.get('options', 'runtime'))
-    write_to_file(config.get('options', 'output_file'), data_collector.data)
+    Args:
+        socket_path (string): path of the unix socket to listen on
+        config (ConfigParser): the base configuration for every run
+
+    Returns:
+        (socketserver.UnixStreamServer): the server, not yet serving
+    """
+    import importlib
+    import json
+    import socketserver
+
+    class RunRequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    options = json.loads(line.decode('utf-8'))
+                    data_collector = run(override_config(config, options))
+                    response = {'status': 'ok',
+                                'readings': len(data_collector)}
+                except Exception as e:
+                    response = {'status': 'error', 'message': str(e)}
+                self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+                self.wfile.flush()
+
+    # Warm the engine up front rather than on the first request
+    for module in ['simpy', 'weather.core']:
+        importlib.import_module(module)
+    return socketserver.UnixStreamServer(socket_path, RunRequestHandler)
+
+
+def override_config(config, options):
+    """Copy the configuration, replacing values in the 'options' section
+
+    Args:
+        config (ConfigParser): the base configuration, left untouched
+        options (dict): option name -> value
+
+    Returns:
+        (ConfigParser): the new configuration
+    """
+    from configparser import ConfigParser
+    overridden = ConfigParser()
+    overridden.read_dict(config)
+    for name, value in options.items():
+        overridden.set('options', name, str(value))
+    return overridden
+
+
+def request_run(socket_path, **options):
+    """Ask a running server to perform a simulation
+
+    Args:
+        socket_path (string): path of the server's unix socket
+        options: overrides for the 'options' section of the configuration
+
+    Returns:
+        (dict): the server's response
+    """
+    import json
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall((json.dumps(options) + '\n').encode('utf-8'))
+        with conn.makefile('rb') as f:
+            return json.loads(f.readline().decode('utf-8'))
+
+
+def parse_args(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description='Run the weather simulation')
+    parser.add_argument('--config', default=DEFAULT_CONFIG_FILE,
+                        help='path to the configuration file')
+    parser.add_argument('--serve', metavar='SOCKET',
+                        help='keep running and accept run requests '
+                             'on this unix socket')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        # Fast path: no need to pay for argparse on the common invocation
+        run(get_config())
+        return
+    args = parse_args(argv)
+    config = get_config(args.config)
+    if args.serve:
+        import os
+        try:
+            with build_server(args.serve, config) as server:
+                server.serve_forever()
+        finally:
+            if os.path.exists(args.serve):
+                os.remove(args.serve)
+    else:
+        run(config)
 
 
 if __name__ == '__main__':
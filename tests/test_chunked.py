@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+import unittest
+
+from weather import chunked, measurements
+
+
+class TestChunkedWriter(unittest.TestCase):
+    def setUp(self):
+        self.output_file = 'tests/scratch_dir/chunked_output.gz'
+        try_delete_file(self.output_file)
+        try_delete_file(chunked.index_file(self.output_file))
+        self.readings = [reading(station, t)
+                         for t in range(10)
+                         for station in ['SYD', 'MEL', 'DRW']]
+
+    def write(self, readings, **kwargs):
+        with chunked.ChunkedWriter(self.output_file, to_line,
+                                   chunk_size=4, workers=2, **kwargs) as writer:
+            for r in readings:
+                writer.put(r)
+
+    def test_all_codecs_should_round_trip(self):
+        for codec in sorted(chunked.CODECS):
+            self.write(self.readings, codec=codec)
+            self.assertEqual(sorted(to_line(r) for r in self.readings),
+                             sorted(chunked.read_lines(self.output_file)))
+
+    def test_unknown_codec_should_raise(self):
+        with self.assertRaises(ValueError):
+            chunked.ChunkedWriter(self.output_file, to_line, codec='zip')
+
+    def test_index_should_describe_chunks(self):
+        self.write(self.readings)
+        codec, chunks = chunked.read_index(self.output_file)
+        self.assertEqual('gzip', codec)
+        # Each station fills two chunks of its own, the last two readings
+        # of the stations are packed together on close
+        self.assertEqual([4, 4, 4, 4, 4, 4, 4, 2], [c.count for c in chunks])
+        self.assertEqual(os.path.getsize(self.output_file),
+                         chunks[-1].offset + chunks[-1].length)
+        self.assertEqual(('SYD', 'SYD', 0, 3),
+                         (chunks[0].first_station, chunks[0].last_station,
+                          chunks[0].start, chunks[0].end))
+        self.assertEqual(('DRW', 'MEL', 8, 9),
+                         (chunks[-2].first_station, chunks[-2].last_station,
+                          chunks[-2].start, chunks[-2].end))
+
+    def test_chunks_should_form_a_valid_gzip_file(self):
+        self.write(self.readings)
+        with gzip.open(self.output_file, 'rt') as f:
+            self.assertEqual(sorted(to_line(r) for r in self.readings),
+                             sorted(f.read().splitlines()))
+
+    def test_reading_a_slice_should_only_read_overlapping_chunks(self):
+        self.write(self.readings)
+        lines = list(chunked.read_lines(self.output_file, start=4, end=5))
+        # Days 4-5 are in each station's chunk of days 4-7
+        self.assertEqual(sorted(to_line(r) for r in self.readings
+                                if 4 <= r.local_time <= 7),
+                         sorted(lines))
+
+    def test_reading_a_station_should_skip_chunks_without_it(self):
+        self.write([reading('SYD', t) for t in range(8)] +
+                   [reading('MEL', t) for t in range(8)])
+        lines = list(chunked.read_lines(self.output_file, station='MEL'))
+        self.assertEqual([to_line(reading('MEL', t)) for t in range(8)], lines)
+
+    def test_reading_a_station_should_skip_chunks_of_other_stations(self):
+        stations = ['ST{:04d}'.format(i) for i in range(100)]
+        readings = [reading(station, t)
+                    for t in range(20) for station in stations]
+        with chunked.ChunkedWriter(self.output_file, to_line,
+                                   chunk_size=50, buffer_size=500) as writer:
+            for r in readings:
+                writer.put(r)
+        _, chunks = chunked.read_index(self.output_file)
+        lines = list(chunked.read_lines(self.output_file, station='ST0007'))
+        self.assertEqual([to_line(reading('ST0007', t)) for t in range(20)],
+                         [line for line in lines if line.startswith('ST0007')])
+        self.assertEqual(len(readings) // len(chunks) * 4, len(lines))
+        self.assertEqual(4, len([c for c in chunks
+                                 if c.first_station <= 'ST0007'
+                                 <= c.last_station]))
+
+    def test_no_readings_should_write_empty_index(self):
+        self.write([])
+        self.assertEqual(('gzip', []), chunked.read_index(self.output_file))
+        self.assertEqual(0, os.path.getsize(self.output_file))
+
+
+def reading(station, local_time):
+    return measurements.WeatherReading(station, -30.0, 140.0, 10.0, local_time,
+                                       measurements.WeatherCondition.Sunny,
+                                       20.0, 1000.0, 50.0)
+
+
+def to_line(r):
+    return '{}|{}'.format(r.station, r.local_time)
+
+
+def try_delete_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
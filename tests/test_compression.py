@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import math
+import random
+import unittest
+
+import simpy
+
+from weather import compression, measurements
+
+
+class TestBitStream(unittest.TestCase):
+    def test_bits_should_round_trip(self):
+        values = [(1, 1), (0, 1), (5, 3), (0, 7), (2 ** 64 - 1, 64), (3, 2),
+                  (12345, 17)]
+        writer = compression.BitWriter()
+        for value, nbits in values:
+            writer.write(value, nbits)
+        self.assertEqual(sum(n for _, n in values), len(writer))
+        reader = compression.BitReader(writer.getvalue())
+        self.assertEqual(values, [(reader.read(n), n) for _, n in values])
+
+    def test_reading_past_the_end_should_raise(self):
+        writer = compression.BitWriter()
+        writer.write(1, 3)
+        reader = compression.BitReader(writer.getvalue())
+        reader.read(8)
+        with self.assertRaises(EOFError):
+            reader.read(1)
+
+
+class TestEncoders(unittest.TestCase):
+    def round_trip(self, encoder_class, values):
+        writer = compression.BitWriter()
+        encoder = encoder_class()
+        for value in values:
+            encoder.encode(writer, value)
+        reader = compression.BitReader(writer.getvalue())
+        decoder = encoder_class()
+        return [decoder.decode(reader) for _ in values], len(writer)
+
+    def test_zigzag(self):
+        for n in [0, -1, 1, -2 ** 40, 2 ** 40]:
+            self.assertEqual(n, compression.unzigzag(compression.zigzag(n)))
+
+    def test_timestamps_should_round_trip(self):
+        timestamps = [0, 0, 1, 2, 3, 10, 11, 12, -5, 100, 10 ** 12, 10 ** 12]
+        decoded, _ = self.round_trip(compression.TimestampEncoder, timestamps)
+        self.assertEqual(timestamps, decoded)
+
+    def test_fixed_interval_should_cost_a_bit_per_timestamp(self):
+        timestamps = list(range(0, 1000, 5))
+        _, bits = self.round_trip(compression.TimestampEncoder, timestamps)
+        # The first interval is a change of the delta, the rest are not
+        self.assertEqual(1 + 2 + 7 + len(timestamps) - 2, bits)
+
+    def test_fractional_timestamps_should_raise(self):
+        with self.assertRaises(ValueError):
+            compression.TimestampEncoder().encode(compression.BitWriter(), 0.5)
+
+    def test_floats_should_round_trip_exactly(self):
+        rng = random.Random(2)
+        values = ([20.0, 20.0, 20.5, -3.25, 0.0, -0.0, math.pi, 1e300, 5e-324] +
+                  [rng.gauss(1000, 20) for _ in range(500)])
+        decoded, _ = self.round_trip(compression.FloatEncoder, values)
+        self.assertEqual([repr(v) for v in values], [repr(v) for v in decoded])
+
+    def test_repeated_floats_should_cost_a_bit(self):
+        _, bits = self.round_trip(compression.FloatEncoder, [1013.25] * 100)
+        self.assertEqual(64 + 99, bits)
+
+
+class TestCompressedCollector(unittest.TestCase):
+    def setUp(self):
+        self.environment = simpy.Environment()
+        self.collector = compression.CompressedCollector(self.environment,
+                                                         msg_queue=None)
+        rng = random.Random(5)
+        conditions = list(measurements.WeatherCondition)
+        self.readings = [measurements.WeatherReading(
+                            station, -30.0 - i, 140.0 + i, 10.0 * i, t,
+                            rng.choice(conditions[:2]),
+                            rng.gauss(20, 3), rng.gauss(1000, 10),
+                            rng.uniform(20, 100))
+                         for t in range(50)
+                         for i, station in enumerate(['SYD', 'MEL', 'DRW'])]
+        for reading in self.readings:
+            self.collector.put(reading)
+
+    def test_new_collector_should_have_no_data(self):
+        collector = compression.CompressedCollector(self.environment, None)
+        self.assertEqual([], collector.data)
+        self.assertEqual(0, len(collector))
+        self.assertEqual(1.0, collector.compression_ratio())
+
+    def test_readings_should_be_decoded_in_collection_order(self):
+        self.assertEqual(len(self.readings), len(self.collector))
+        self.assertEqual(self.readings, self.collector.data)
+
+    def test_readings_for_station(self):
+        self.assertEqual([r for r in self.readings if r.station == 'MEL'],
+                         self.collector.readings_for_station('MEL'))
+        self.assertEqual([], self.collector.readings_for_station('PER'))
+
+    def test_readings_should_be_compressed(self):
+        self.assertGreater(self.collector.compression_ratio(), 2)
+
+    def test_moving_station_should_raise(self):
+        moved = self.readings[0]._replace(latitude=0.0)
+        with self.assertRaises(ValueError):
+            self.collector.put(moved)
+
+    def test_readings_should_be_collected_from_the_queue(self):
+        environment = simpy.Environment()
+        queue = simpy.Store(environment)
+        collector = compression.CompressedCollector(environment, queue)
+        for reading in self.readings[:6]:
+            queue.put(reading)
+        environment.run(until=1)
+        self.assertEqual(self.readings[:6], collector.data)
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from weather import weather_station, WeatherState, DataCollector, BroadcastPipe
+from weather import WeatherReading, WeatherCondition, core, spatial
 import simpy
 import unittest
 from collections import namedtuple
@@ -73,12 +74,161 @@ class CollectorTest(unittest.TestCase):
         multiple_records = [1, 2, 3, 4, 5]
         self.check_record_collection(multiple_records)
 
+    def test_readings_should_be_queryable_by_station(self):
+        readings = [fake_reading('SYD', 0), fake_reading('MEL', 0),
+                    fake_reading('SYD', 1)]
+        for reading in readings:
+            self.collector.put(reading)
+        self.assertEqual([readings[0], readings[2]],
+                         self.collector.readings_for_station('SYD'))
+        self.assertEqual([], self.collector.readings_for_station('DRW'))
+
+    def test_readings_should_be_queryable_by_region(self):
+        readings = [fake_reading('SYD', 0), fake_reading('DRW', 0),
+                    fake_reading('MEL', 0), fake_reading('SYD', 1),
+                    fake_reading('MEL', 1)]
+        for reading in readings:
+            self.collector.put(reading)
+        south_east = spatial.BoundingBox(-40, 140, -30, 155)
+        self.assertEqual([readings[0], readings[2], readings[3], readings[4]],
+                         self.collector.readings_in_region(south_east))
+        around_darwin = spatial.Circle(-12.46, 130.84, radius_km=100)
+        self.assertEqual([readings[1]],
+                         self.collector.readings_in_region(around_darwin))
+
+    def test_readings_between_should_select_time_range(self):
+        readings = [fake_reading('SYD', t) for t in range(10)]
+        for reading in readings:
+            self.collector.put(reading)
+        self.collector.put(fake_reading('MEL', 3))
+        self.assertEqual(readings[2:5],
+                         self.collector.readings_between('SYD', 2, 5))
+        self.assertEqual([], self.collector.readings_between('SYD', 20, 30))
+        self.assertEqual([], self.collector.readings_between('DRW', 0, 10))
+
+    def test_out_of_order_readings_should_be_kept_in_time_order(self):
+        late, early, middle = [fake_reading('SYD', t) for t in [5, 1, 3]]
+        for reading in [late, early, middle]:
+            self.collector.put(reading)
+        self.assertEqual([early, middle, late],
+                         self.collector.readings_for_station('SYD'))
+        self.assertEqual([middle], self.collector.readings_on_day(3))
+        self.assertEqual(late, self.collector.latest_reading('SYD'))
+
+    def test_latest_reading(self):
+        self.assertIsNone(self.collector.latest_reading('SYD'))
+        for t in range(3):
+            self.collector.put(fake_reading('SYD', t, temperature=t))
+        self.assertEqual(2, self.collector.latest_reading('SYD').temperature)
+
+    def test_readings_on_day_should_cover_all_stations(self):
+        readings = [fake_reading(station, t)
+                    for t in [0, 0.5, 1, 1.5, 2]
+                    for station in ['SYD', 'MEL']]
+        for reading in readings:
+            self.collector.put(reading)
+        self.assertEqual(readings[4:8], self.collector.readings_on_day(1))
+        self.assertEqual([], self.collector.readings_on_day(7))
+
     def check_record_collection(self, records_to_collect):
         self.environment.process(fake_process(self.environment, self.pipe, records_to_collect))
         self.environment.run(until=15)
         self.assertEqual(records_to_collect, self.collector.data)
 
 
+LOCATIONS = {'SYD': (-33.87, 151.21),
+             'MEL': (-37.81, 144.96),
+             'DRW': (-12.46, 130.84)}
+
+
+def fake_reading(station, local_time, temperature=20):
+    latitude, longitude = LOCATIONS[station]
+    return WeatherReading(station=station,
+                          latitude=latitude,
+                          longitude=longitude,
+                          altitude=10,
+                          local_time=local_time,
+                          conditions=WeatherCondition.Sunny,
+                          temperature=temperature,
+                          pressure=1000,
+                          humidity=50)
+
+
+class BroadcastPipeTest(unittest.TestCase):
+    def test_subscribers_and_pipes_should_receive_all_messages(self):
+        environment = simpy.Environment()
+        pipe = BroadcastPipe(environment)
+        collector = DataCollector(environment, pipe.get_output_conn())
+        received = []
+        pipe.subscribe(received.append, capacity=2, name='received')
+        environment.process(fake_process(environment, pipe, range(10)))
+        environment.run(until=15)
+        metrics = pipe.close()
+        self.assertEqual(list(range(10)), received)
+        self.assertEqual(list(range(10)), collector.data)
+        self.assertEqual(['received'], [m['name'] for m in metrics])
+
+    def test_put_without_receivers_should_raise(self):
+        pipe = BroadcastPipe(simpy.Environment())
+        with self.assertRaises(RuntimeError):
+            pipe.put(1)
+
+
+class SpillingCollectorTest(unittest.TestCase):
+    def setUp(self):
+        self.environment = simpy.Environment()
+        self.readings = [fake_reading(station, t, temperature=t)
+                         for t in range(1000)
+                         for station in ['SYD', 'MEL', 'DRW']]
+        self.reading_size = core.estimate_record_size(self.readings[0])
+        self.collector = self.collect(memory_limit=2000 * self.reading_size)
+
+    def collect(self, memory_limit):
+        collector = DataCollector(self.environment,
+                                  msg_queue=None,
+                                  memory_limit=memory_limit)
+        for reading in self.readings:
+            collector.put(reading)
+        return collector
+
+    def test_footprint_should_stay_within_memory_limit(self):
+        self.assertTrue(self.collector._segments)
+        self.assertLessEqual(self.collector.footprint,
+                             self.collector.memory_limit)
+        self.assertEqual(len(self.readings), len(self.collector))
+
+    def test_footprint_should_include_the_indexes(self):
+        collector = DataCollector(self.environment, msg_queue=None)
+        collector.put(self.readings[0])
+        self.assertGreaterEqual(collector.footprint, core.INDEX_ENTRY_SIZE)
+
+    def test_tiny_limit_should_not_write_tiny_segments(self):
+        collector = self.collect(memory_limit=1)
+        self.assertEqual(len(self.readings) // core.MIN_SEGMENT_RECORDS,
+                         len(collector._segments))
+        self.assertEqual(self.readings, list(collector))
+
+    def test_iteration_should_load_spilled_readings(self):
+        self.assertEqual(self.readings, list(self.collector))
+        self.assertEqual(self.readings, self.collector.data)
+
+    def test_queries_should_load_spilled_readings(self):
+        self.assertEqual(self.readings[0], self.collector.readings_on_day(0)[0])
+        self.assertEqual([r for r in self.readings if r.station == 'MEL'],
+                         self.collector.readings_for_station('MEL'))
+        self.assertEqual(999, self.collector.latest_reading('DRW').temperature)
+
+    def test_queries_should_not_keep_a_segment_loaded(self):
+        self.collector.readings_on_day(0)
+        self.assertEqual((None, None), self.collector._loaded_segment)
+
+    def test_unlimited_collector_should_not_spill(self):
+        collector = DataCollector(self.environment, msg_queue=None)
+        for reading in self.readings:
+            collector.put(reading)
+        self.assertIs(collector._data, collector.data)
+
+
 def fake_process(environment, queue, data):
     for i in data:
         queue.put(i)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+from weather import ensemble, helpers, measurements
+
+
+RECORD = {'station': 'CBR', 'latitude': '-35.28', 'longitude': '149.13',
+          'altitude': '575', 'hottest_day': '15', 'low_temp': '-3',
+          'high_temp': '28'}
+
+
+class FakeEnv(object):
+    now = 0
+
+
+class TestPercentile(unittest.TestCase):
+    def test_single_value(self):
+        self.assertEqual(3, ensemble.percentile([3], 95))
+
+    def test_interpolation_between_ranks(self):
+        values = [1, 2, 3, 4, 5]
+        self.assertEqual(1, ensemble.percentile(values, 0))
+        self.assertEqual(3, ensemble.percentile(values, 50))
+        self.assertEqual(5, ensemble.percentile(values, 100))
+        self.assertAlmostEqual(1.4, ensemble.percentile(values, 10))
+
+
+class TestBuildEnsemble(unittest.TestCase):
+    def setUp(self):
+        self.environment = FakeEnv()
+
+    def test_no_members_should_raise(self):
+        with self.assertRaises(ValueError):
+            ensemble.build_ensemble(self.environment, RECORD, 0, [50], 0.1, 0.1)
+
+    def test_without_variation_members_should_follow_the_baseline(self):
+        transformer, summary = ensemble.build_ensemble(self.environment,
+                                                       RECORD,
+                                                       members=50,
+                                                       percentiles=[5, 95],
+                                                       temperature_sigma=0,
+                                                       pressure_sigma=0)
+        self.environment.now = 100
+        summary = transformer(summary)
+        expected_temperature = helpers.temperature(100, 15, -3, 28)
+        self.assertAlmostEqual(expected_temperature, summary.temperature[0])
+        self.assertAlmostEqual(expected_temperature, summary.temperature[1])
+        self.assertAlmostEqual(helpers.pressure(575), summary.pressure[1])
+        self.assertEqual((1.0, 0.0, 0.0, 0.0), summary.conditions)
+        self.assertEqual(('CBR', 100, 50),
+                         (summary.station, summary.local_time, summary.members))
+
+    def test_percentiles_should_be_ordered_and_probabilities_sum_to_one(self):
+        transformer, summary = ensemble.build_ensemble(self.environment,
+                                                       RECORD,
+                                                       members=500,
+                                                       percentiles=[5, 50, 95],
+                                                       temperature_sigma=0.15,
+                                                       pressure_sigma=0.02)
+        for day in range(1, 30):
+            self.environment.now = day
+            summary = transformer(summary)
+            for values in [summary.temperature,
+                           summary.pressure,
+                           summary.humidity]:
+                self.assertEqual(sorted(values), list(values))
+            self.assertAlmostEqual(1, sum(summary.conditions))
+
+    def test_single_member_should_match_the_fused_transformer(self):
+        random.seed(3)
+        transformer, summary = ensemble.build_ensemble(self.environment,
+                                                       RECORD,
+                                                       members=1,
+                                                       percentiles=[50],
+                                                       temperature_sigma=0.15,
+                                                       pressure_sigma=0.02)
+        summaries = []
+        for day in range(1, 365):
+            self.environment.now = day
+            summary = transformer(summary)
+            summaries.append(summary)
+
+        random.seed(3)
+        self.environment.now = 0
+        reading = measurements.WeatherReading(
+                        'CBR', -35.28, 149.13, 575.0, 0,
+                        measurements.WeatherCondition.Sunny,
+                        helpers.temperature(0, 15, -3, 28) * random.gauss(1, 0.15),
+                        helpers.pressure(575) * random.gauss(1, 0.02),
+                        random.uniform(20, 100))
+        fused = helpers.build_fused_transformer(self.environment, 15, -3, 28,
+                                                575, 0.15, 0.02)
+        for summary in summaries:
+            self.environment.now = summary.local_time
+            reading = fused(reading)
+            self.assertEqual((reading.temperature,), summary.temperature)
+            self.assertEqual((reading.pressure,), summary.pressure)
+            self.assertEqual((reading.humidity,), summary.humidity)
+            self.assertEqual(1.0, summary.conditions[reading.conditions.value])
+
+
+class TestReportLine(unittest.TestCase):
+    def test_conversion_to_string(self):
+        summary = ensemble.EnsembleSummary('SYD', -33.86, 151.12, 10, 7, 100,
+                                           (18, 22), (1000, 1020), (40, 80),
+                                           (0.5, 0.25, 0.25, 0.0))
+        self.assertEqual('SYD|7|100|18|22|1000|1020|40|80|0.5|0.25|0.25|0.0',
+                         ensemble.ensemble_summary_to_report_line(summary, '|'))
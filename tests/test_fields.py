@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import random
+import statistics
+import unittest
+
+from weather import fields
+
+
+class FakeEnv(object):
+    def __init__(self):
+        self.now = 0
+
+
+class TestSharedField(unittest.TestCase):
+    def setUp(self):
+        self.environment = FakeEnv()
+        self.field = fields.SharedField(self.environment,
+                                        resolution=5,
+                                        gauss=random.Random(1).gauss)
+
+    def test_field_should_be_constant_within_a_tick(self):
+        sample = self.field.sampler(-33.87, 151.21)
+        self.assertEqual(sample(), sample())
+        self.environment.now = 1
+        first = sample()
+        self.environment.now = 2
+        self.assertNotEqual(first, sample())
+
+    def test_colocated_stations_should_see_the_same_value(self):
+        self.assertEqual(self.field.sampler(-33.87, 151.21)(),
+                         self.field.sampler(-33.87, 151.21)())
+
+    def test_stations_on_a_node_should_see_the_node_value(self):
+        node_value = self.field._node((-7, 30))
+        self.assertEqual(node_value, self.field.sampler(-35, 150)())
+
+    def test_stations_across_the_antimeridian_should_share_nodes(self):
+        self.assertAlmostEqual(self.field.sampler(-15, 180)(),
+                               self.field.sampler(-15, -180)())
+
+    def test_resolution_should_divide_360_degrees(self):
+        fields.SharedField(self.environment, resolution=2.5)
+        for resolution in [7, 0, -5]:
+            with self.assertRaises(ValueError):
+                fields.SharedField(self.environment, resolution=resolution)
+
+    def test_neighbours_should_be_correlated_and_distant_stations_not(self):
+        sydney = self.field.sampler(-33.87, 151.21)
+        newcastle = self.field.sampler(-32.93, 151.78)
+        perth = self.field.sampler(-31.95, 115.86)
+        samples = []
+        for tick in range(2000):
+            self.environment.now = tick
+            samples.append((sydney(), newcastle(), perth()))
+        syd, ncl, per = zip(*samples)
+        self.assertGreater(correlation(syd, ncl), 0.8)
+        self.assertLess(abs(correlation(syd, per)), 0.1)
+        for values in [syd, ncl, per]:
+            self.assertAlmostEqual(1, statistics.pstdev(values), delta=0.1)
+
+
+class TestBuildVariation(unittest.TestCase):
+    def test_variation_should_scale_by_the_field(self):
+        field = fields.SharedField(FakeEnv(), gauss=lambda mu, sigma: 2.0)
+        variation = fields.build_variation(field, 0, 0, sigma=0.1)
+        self.assertAlmostEqual(12.0, variation(10))
+
+
+def correlation(xs, ys):
+    mx, my = statistics.mean(xs), statistics.mean(ys)
+    cov = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    return cov / (len(xs) * statistics.pstdev(xs) * statistics.pstdev(ys))
@@ -5,6 +5,7 @@ import datetime
 import shutil
 import os
 import csv
+import random
 
 import weather.helpers as helpers
 import weather.measurements as measurements
@@ -111,6 +112,53 @@ class TestWeatherTransformation(unittest.TestCase):
         self.assertEqual(base_weather, transformer(base_weather))
 
 
+class TestFusedTransformer(unittest.TestCase):
+    class FakeEnv(object):
+        now = 0
+
+    def test_should_match_the_composed_transformer(self):
+        environment = self.FakeEnv()
+        hottest_day, low_temp, high_temp, altitude = 45, -5, 30, 575
+        temperature_sigma, pressure_sigma = 0.15, 0.02
+
+        def variation(sigma):
+            return lambda value: value * random.gauss(mu=1, sigma=sigma)
+
+        composed = helpers.build_transformer(
+                        environment,
+                        helpers.weather_condition,
+                        helpers.build_temperature_updater(
+                            variation(temperature_sigma),
+                            hottest_day, low_temp, high_temp),
+                        lambda alt: variation(pressure_sigma)(helpers.pressure(alt)),
+                        helpers.humidity_updater)
+        fused = helpers.build_fused_transformer(environment,
+                                                hottest_day,
+                                                low_temp,
+                                                high_temp,
+                                                altitude,
+                                                temperature_sigma,
+                                                pressure_sigma)
+
+        def run(transformer):
+            random.seed(7)
+            reading = measurements.WeatherReading(
+                            'CBR', -35.3, 149.1, altitude, 0,
+                            measurements.WeatherCondition.Sunny,
+                            20, 950, 50)
+            readings = []
+            for day in range(365):
+                environment.now = day
+                reading = transformer(reading)
+                readings.append(reading)
+            return readings
+
+        expected = run(composed)
+        self.assertEqual(expected, run(fused))
+        self.assertEqual(set(measurements.WeatherCondition),
+                         set(r.conditions for r in expected))
+
+
 class TestTemperature(unittest.TestCase):
 
     def test_constant_temperature(self):
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from weather import measurements, rollups
+
+
+class TestWindows(unittest.TestCase):
+    def test_daily_window(self):
+        self.assertEqual((3, 4), rollups.daily_window(3))
+        self.assertEqual((3, 4), rollups.daily_window(3.5))
+
+    def test_monthly_window(self):
+        self.assertEqual((0, 31), rollups.monthly_window(0))
+        self.assertEqual((31, 59), rollups.monthly_window(58))
+        self.assertEqual((334, 365), rollups.monthly_window(364))
+        self.assertEqual((365 + 59, 365 + 90), rollups.monthly_window(365 + 60))
+
+    def test_yearly_window(self):
+        self.assertEqual((0, 365), rollups.yearly_window(364))
+        self.assertEqual((365, 730), rollups.yearly_window(365))
+
+
+class TestRollupWriter(unittest.TestCase):
+    def setUp(self):
+        self.output_file = 'tests/scratch_dir/rollup_output.csv'
+        for tier in rollups.TIERS:
+            try_delete_file(rollups.rollup_file(self.output_file, tier))
+
+    def test_unknown_tier_should_raise(self):
+        with self.assertRaises(ValueError):
+            rollups.RollupWriter(self.output_file, tiers=['hourly'])
+
+    def test_windows_should_aggregate_their_readings(self):
+        readings = [reading('SYD', t, temperature=t) for t in range(59)]
+        readings[40] = readings[40]._replace(
+                            conditions=measurements.WeatherCondition.Rain)
+        with rollups.RollupWriter(self.output_file) as writer:
+            for r in readings:
+                writer.put(r)
+
+        daily = list(rollups.read_rollups(self.output_file, 'daily'))
+        self.assertEqual(59, len(daily))
+        self.assertEqual((5, 6, 1), (daily[5].start, daily[5].end, daily[5].count))
+
+        january, february = rollups.read_rollups(self.output_file, 'monthly')
+        self.assertEqual(('SYD', 0, 31, 31),
+                         (january.station, january.start, january.end,
+                          january.count))
+        self.assertEqual(rollups.FieldSummary(0, 30, 15), january.temperature)
+        self.assertEqual(rollups.FieldSummary(1000, 1000, 1000),
+                         january.pressure)
+        self.assertEqual((31, 0, 0, 0), january.conditions)
+        self.assertEqual((31, 59, 28), (february.start, february.end,
+                                        february.count))
+        self.assertEqual((27, 0, 1, 0), february.conditions)
+
+        year, = rollups.read_rollups(self.output_file, 'yearly')
+        self.assertEqual(rollups.FieldSummary(0, 58, 29), year.temperature)
+
+    def test_stations_should_be_aggregated_separately(self):
+        with rollups.RollupWriter(self.output_file, tiers=['yearly']) as writer:
+            for t in range(3):
+                writer.put(reading('SYD', t, temperature=10))
+                writer.put(reading('MEL', t, temperature=20))
+        melbourne, = rollups.read_rollups(self.output_file, 'yearly',
+                                          station='MEL')
+        self.assertEqual(3, melbourne.count)
+        self.assertEqual(20, melbourne.temperature.mean)
+        self.assertFalse(os.path.exists(
+                            rollups.rollup_file(self.output_file, 'daily')))
+
+    def test_report_line_should_round_trip(self):
+        rollup = rollups.Rollup('SYD', 31, 59, 28,
+                                rollups.FieldSummary(10.5, 20.0, 15.25),
+                                rollups.FieldSummary(990.0, 1020.0, 1001.0),
+                                rollups.FieldSummary(20.0, 99.5, 60.0),
+                                conditions=(20, 5, 3, 0))
+        line = rollups.rollup_to_report_line(rollup, '|')
+        self.assertEqual('SYD|31|59|28|10.5|20.0|15.25|990.0|1020.0|1001.0|'
+                         '20.0|99.5|60.0|20|5|3|0', line)
+        self.assertEqual(rollup, rollups.report_line_to_rollup(line, '|'))
+
+
+def reading(station, local_time, temperature=20):
+    return measurements.WeatherReading(station, -33.9, 151.2, 10.0, local_time,
+                                       measurements.WeatherCondition.Sunny,
+                                       temperature, 1000, 50)
+
+
+def try_delete_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+import os
+import random
+import subprocess
+import sys
+import threading
+import unittest
+
+import run_sim
+
+
+class TestStartup(unittest.TestCase):
+    def test_importing_entry_point_should_not_load_the_engine(self):
+        deferred = ['simpy', 'weather.core', 'statistics', 'csv', 'socketserver']
+        script = ('import sys, run_sim; '
+                  'print(",".join(m for m in {!r} if m in sys.modules))'
+                  .format(deferred))
+        result = subprocess.run([sys.executable, '-c', script],
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True,
+                                check=True)
+        self.assertEqual('', result.stdout.strip())
+
+    def test_package_exports_should_resolve_lazily(self):
+        import weather
+        from weather import measurements
+        self.assertIs(measurements.WeatherReading, weather.WeatherReading)
+        with self.assertRaises(AttributeError):
+            weather.not_an_export
+
+
+class TestRegion(unittest.TestCase):
+    def test_only_stations_in_region_should_be_simulated(self):
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'region_bbox': '-36, 130, -10, 140'})
+        simulation, collector = run_sim.build_sim_with_collector_and_screen_printer(
+                                                                        config)
+        simulation.run(until=1)
+        self.assertEqual(['ADL', 'ASP', 'DRW'],
+                         sorted(r.station for r in collector.data))
+
+
+class TestCorrelatedFields(unittest.TestCase):
+    def test_colocated_stations_should_vary_together(self):
+        import simpy
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'correlated_fields': 'yes'})
+        environment = simpy.Environment()
+        builders = run_sim.get_variation_builders(config, environment)
+        record = {'latitude': '-33.87', 'longitude': '151.21'}
+        first = [build(record) for build in builders]
+        second = [build(record) for build in builders]
+        environment.run(until=1)
+        self.assertEqual(first[0](20), second[0](20))
+        self.assertEqual(first[1](1000), second[1](1000))
+
+    def test_independent_variation_by_default(self):
+        self.assertIsNone(run_sim.get_variation_builders(run_sim.get_config(),
+                                                         environment=None))
+
+
+class TestMemoryEstimate(unittest.TestCase):
+    def test_estimate_should_scale_with_stations_and_runtime(self):
+        readings, size = run_sim.estimate_memory(10, 365, lambda: 1)
+        self.assertEqual(3650, readings)
+        readings, double_size = run_sim.estimate_memory(10, 730, lambda: 1)
+        self.assertEqual(7300, readings)
+        self.assertEqual(2 * size, double_size)
+
+    def test_ensemble_summaries_should_be_sized(self):
+        readings, size = run_sim.estimate_memory(10, 365, lambda: 1)
+        summaries, summary_size = run_sim.estimate_memory(
+                                    10, 365, lambda: 1, (100, [5, 50, 95]))
+        self.assertEqual(readings, summaries)
+        self.assertGreater(summary_size, size)
+
+    def test_memory_limit_is_optional(self):
+        config = run_sim.get_config()
+        self.assertIsNone(run_sim.get_memory_limit(config))
+        config = run_sim.override_config(config, {'memory_limit_mb': 2})
+        self.assertEqual(2 * 1024 * 1024, run_sim.get_memory_limit(config))
+
+
+class TestChunkedOutput(unittest.TestCase):
+    def test_chunked_output_should_hold_all_readings(self):
+        from weather import chunked
+        output_file = 'tests/scratch_dir/chunked_run.csv.gz'
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'runtime': 5,
+                                          'output_file': output_file,
+                                          'output_format': 'chunked',
+                                          'chunk_readings': 7})
+        collector = run_sim.run(config)
+        self.assertEqual(sorted(run_sim.report_line(r) for r in collector),
+                         sorted(chunked.read_lines(output_file)))
+
+    def test_failed_build_should_leave_previous_output_untouched(self):
+        output_file = 'tests/scratch_dir/chunked_run.csv.gz'
+        with open(output_file, 'w') as f:
+            f.write('previous run')
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'runtime': 5,
+                                          'output_file': output_file,
+                                          'output_format': 'chunked',
+                                          'collector_backend': 'redis'})
+        with self.assertRaises(ValueError):
+            run_sim.run(config)
+        with open(output_file) as f:
+            self.assertEqual('previous run', f.read())
+
+    def test_threaded_collector_should_run_off_the_simulation(self):
+        outputs = []
+        for threaded in ['no', 'yes']:
+            output_file = 'tests/scratch_dir/threaded_{}.csv'.format(threaded)
+            config = run_sim.override_config(run_sim.get_config(),
+                                             {'runtime': 200,
+                                              'output_file': output_file,
+                                              'memory_limit_mb': 0.1,
+                                              'threaded_subscribers': threaded,
+                                              'ring_buffer_size': 16})
+            if threaded == 'yes':
+                _, collector, broadcast_queue = run_sim.build_simulation(config)
+                self.assertEqual([], broadcast_queue.pipes)
+                self.assertIn('DataCollector',
+                              [m['name'] for m in broadcast_queue.close()])
+            random.seed(3)
+            collector = run_sim.run(config)
+            self.assertTrue(collector._segments)
+            with open(output_file) as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_threaded_writer_should_hold_all_readings(self):
+        from weather import chunked
+        output_file = 'tests/scratch_dir/threaded_run.csv.gz'
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'runtime': 5,
+                                          'output_file': output_file,
+                                          'output_format': 'chunked',
+                                          'chunk_readings': 7,
+                                          'threaded_subscribers': 'yes',
+                                          'ring_buffer_size': 4})
+        collector = run_sim.run(config)
+        self.assertEqual(sorted(run_sim.report_line(r) for r in collector),
+                         sorted(chunked.read_lines(output_file)))
+
+    def test_unknown_output_format_should_raise(self):
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'output_format': 'parquet'})
+        with self.assertRaises(ValueError):
+            run_sim.build_output_writer(config)
+
+
+class TestCollectorBackend(unittest.TestCase):
+    def test_compressed_backend_should_write_the_same_output(self):
+        outputs = []
+        for backend in ['memory', 'compressed']:
+            output_file = 'tests/scratch_dir/{}_output.csv'.format(backend)
+            random.seed(11)
+            run_sim.run(run_sim.override_config(run_sim.get_config(),
+                                                {'runtime': 10,
+                                                 'output_file': output_file,
+                                                 'collector_backend': backend}))
+            with open(output_file) as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_compressed_backend_should_reject_memory_limit(self):
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'collector_backend': 'compressed',
+                                          'memory_limit_mb': 1})
+        with self.assertRaises(ValueError):
+            run_sim.build_sim_with_collector_and_screen_printer(config)
+
+    def test_unknown_backend_should_raise(self):
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'collector_backend': 'redis'})
+        with self.assertRaises(ValueError):
+            run_sim.build_sim_with_collector_and_screen_printer(config)
+
+
+class TestRollups(unittest.TestCase):
+    def test_rollups_should_cover_all_readings(self):
+        from weather import rollups
+        output_file = 'tests/scratch_dir/rollup_run.csv'
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'runtime': 40,
+                                          'output_file': output_file,
+                                          'rollups': 'daily, monthly'})
+        collector = run_sim.run(config)
+        for tier in ['daily', 'monthly']:
+            self.assertEqual(len(collector),
+                             sum(r.count for r in rollups.read_rollups(
+                                                        output_file, tier)))
+        february = [r for r in rollups.read_rollups(output_file, 'monthly',
+                                                    station='ADL')
+                    if r.start == 31][0]
+        temperatures = [r.temperature for r in
+                        collector.readings_between('ADL', 31, 59)]
+        self.assertEqual(max(temperatures), february.temperature.maximum)
+
+    def test_failed_build_should_leave_previous_rollups_untouched(self):
+        from weather import rollups
+        output_file = 'tests/scratch_dir/rollup_run.csv'
+        daily_file = rollups.rollup_file(output_file, 'daily')
+        with open(daily_file, 'w') as f:
+            f.write('previous run')
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'runtime': 5,
+                                          'output_file': output_file,
+                                          'rollups': 'daily',
+                                          'collector_backend': 'redis'})
+        with self.assertRaises(ValueError):
+            run_sim.run(config)
+        with open(daily_file) as f:
+            self.assertEqual('previous run', f.read())
+
+    def test_rollups_should_not_combine_with_ensembles(self):
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'rollups': 'daily',
+                                          'ensemble_members': 10})
+        with self.assertRaises(ValueError):
+            run_sim.build_rollup_writer(config)
+
+
+class TestEnsemble(unittest.TestCase):
+    def test_ensemble_run_should_write_one_summary_per_station_and_day(self):
+        output_file = 'tests/scratch_dir/ensemble_output.csv'
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'runtime': 3,
+                                          'output_file': output_file,
+                                          'ensemble_members': 20,
+                                          'ensemble_percentiles': '10, 90'})
+        run_sim.run(config)
+        with open(output_file) as f:
+            lines = f.read().splitlines()
+        number_of_stations = 10
+        self.assertEqual(3 * number_of_stations, len(lines))
+        fields = 3 + 3 * 2 + 4
+        self.assertEqual({fields}, set(len(l.split('|')) for l in lines))
+
+    def test_ensemble_should_not_combine_with_correlated_fields(self):
+        config = run_sim.override_config(run_sim.get_config(),
+                                         {'ensemble_members': 20,
+                                          'correlated_fields': 'yes'})
+        with self.assertRaises(ValueError):
+            run_sim.build_sim_with_collector_and_screen_printer(config)
+
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.socket_path = 'tests/scratch_dir/sim.sock'
+        self.output_file = 'tests/scratch_dir/server_output.csv'
+        try_delete_file(self.socket_path)
+        try_delete_file(self.output_file)
+        self.server = run_sim.build_server(self.socket_path,
+                                           run_sim.get_config())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        try_delete_file(self.socket_path)
+
+    def test_run_request_should_run_simulation(self):
+        response = run_sim.request_run(self.socket_path,
+                                       runtime=2,
+                                       output_file=self.output_file)
+        number_of_stations = 10
+        self.assertEqual({'status': 'ok', 'readings': 2 * number_of_stations},
+                         response)
+        self.assertTrue(os.path.exists(self.output_file))
+
+    def test_bad_request_should_report_error(self):
+        response = run_sim.request_run(self.socket_path,
+                                       stations='does/not/exist.csv')
+        self.assertEqual('error', response['status'])
+
+
+def try_delete_file(filename):
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from weather import spatial
+
+
+class TestDistance(unittest.TestCase):
+    def test_same_point_should_have_no_distance(self):
+        self.assertAlmostEqual(0, spatial.distance_km(-33.9, 151.2, -33.9, 151.2))
+
+    def test_sydney_to_melbourne(self):
+        self.assertAlmostEqual(713,
+                               spatial.distance_km(-33.87, 151.21, -37.81, 144.96),
+                               delta=5)
+
+
+class TestGridIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = spatial.GridIndex(cell_size=5)
+        self.index.insert('SYD', -33.87, 151.21)
+        self.index.insert('MEL', -37.81, 144.96)
+        self.index.insert('DRW', -12.46, 130.84)
+        self.index.insert('FJI', -18.14, 178.44)
+        self.index.insert('SAM', -13.83, -171.76)
+
+    def test_empty_index_should_find_nothing(self):
+        index = spatial.GridIndex()
+        self.assertEqual(0, len(index))
+        self.assertEqual([], index.query(spatial.BoundingBox(-90, -180, 90, 180)))
+
+    def test_bounding_box_query(self):
+        south_east = spatial.BoundingBox(-40, 140, -30, 155)
+        self.assertEqual(['MEL', 'SYD'], sorted(self.index.query(south_east)))
+
+    def test_bounding_box_should_include_its_edges(self):
+        just_sydney = spatial.BoundingBox(-33.87, 151.21, -33.87, 151.21)
+        self.assertEqual(['SYD'], self.index.query(just_sydney))
+
+    def test_bounding_box_across_antimeridian(self):
+        pacific = spatial.BoundingBox(-20, 175, -10, -170)
+        self.assertEqual(['FJI', 'SAM'], sorted(self.index.query(pacific)))
+
+    def test_station_on_the_antimeridian(self):
+        self.index.insert('AM', 0, 180.0)
+        for box in [spatial.BoundingBox(-1, 170, 1, 180),
+                    spatial.BoundingBox(-1, 175, 1, -175),
+                    spatial.BoundingBox(-1, -180, 1, 180)]:
+            self.assertTrue(spatial.contains(box, 0, 180.0))
+            self.assertEqual(['AM'], self.index.query(box))
+
+    def test_radius_query(self):
+        around_sydney = spatial.Circle(-33.87, 151.21, radius_km=800)
+        self.assertEqual(['MEL', 'SYD'], sorted(self.index.query(around_sydney)))
+        self.assertEqual(['SYD'],
+                         self.index.query(spatial.Circle(-33.87, 151.21, 10)))
+
+    def test_radius_query_across_antimeridian(self):
+        around_fiji = spatial.Circle(-18.14, 178.44, radius_km=1500)
+        self.assertEqual(['FJI', 'SAM'], sorted(self.index.query(around_fiji)))
+
+    def test_radius_query_covering_the_pole(self):
+        everything = spatial.Circle(-89, 0, radius_km=10000)
+        self.assertEqual(5, len(self.index.query(everything)))
+
+
+class TestParseRegion(unittest.TestCase):
+    def test_no_region(self):
+        self.assertIsNone(spatial.parse_region())
+
+    def test_bounding_box(self):
+        self.assertEqual(spatial.BoundingBox(-40, 140, -30, 155),
+                         spatial.parse_region(bbox='-40, 140, -30, 155'))
+
+    def test_circle(self):
+        self.assertEqual(spatial.Circle(-33.5, 151, 100),
+                         spatial.parse_region(center='-33.5,151', radius_km='100'))
+
+    def test_circle_requires_radius(self):
+        with self.assertRaises(ValueError):
+            spatial.parse_region(center='-33.5,151')
+
+    def test_wrong_number_of_values(self):
+        with self.assertRaises(ValueError):
+            spatial.parse_region(bbox='1, 2, 3')
+
+
+class TestIndexRecords(unittest.TestCase):
+    def test_records_should_be_keyed_by_position(self):
+        records = [{'latitude': '-33.87', 'longitude': '151.21'},
+                   {'latitude': '-12.46', 'longitude': '130.84'}]
+        index = spatial.index_records(records)
+        self.assertEqual([1], index.query(spatial.BoundingBox(-20, 120, 0, 140)))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+
+from weather import threaded
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_empty_buffer(self):
+        ring = threaded.RingBuffer(capacity=2)
+        self.assertEqual(0, len(ring))
+        self.assertEqual((False, None), ring.try_get())
+
+    def test_values_should_come_out_in_order_across_wrap_around(self):
+        ring = threaded.RingBuffer(capacity=3)
+        out = []
+        for i in range(10):
+            self.assertTrue(ring.try_put(i))
+            if i % 2:
+                out.append(ring.try_get()[1])
+                out.append(ring.try_get()[1])
+        self.assertEqual(list(range(10)), out)
+
+    def test_full_buffer_should_reject_values(self):
+        ring = threaded.RingBuffer(capacity=2)
+        self.assertTrue(ring.try_put('a'))
+        self.assertTrue(ring.try_put('b'))
+        self.assertFalse(ring.try_put('c'))
+        self.assertEqual((True, 'a'), ring.try_get())
+        self.assertTrue(ring.try_put('c'))
+        self.assertEqual(2, len(ring))
+
+    def test_capacity_should_be_positive(self):
+        with self.assertRaises(ValueError):
+            threaded.RingBuffer(capacity=0)
+
+
+class TestThreadedSubscriber(unittest.TestCase):
+    def test_all_values_should_be_consumed_in_order_after_close(self):
+        consumed = []
+        subscriber = threaded.ThreadedSubscriber(consumed.append, capacity=8)
+        for i in range(1000):
+            subscriber.put(i)
+        subscriber.close()
+        self.assertEqual(list(range(1000)), consumed)
+        metrics = subscriber.metrics()
+        self.assertEqual(1000, metrics['published'])
+        self.assertEqual(1000, metrics['consumed'])
+        self.assertEqual(0, metrics['lag'])
+        self.assertLessEqual(metrics['max_lag'], 8)
+
+    def test_consumer_should_run_off_the_publishing_thread(self):
+        threads = []
+        subscriber = threaded.ThreadedSubscriber(
+                        lambda _: threads.append(threading.current_thread()),
+                        name='recorder')
+        subscriber.put(1)
+        subscriber.close()
+        self.assertEqual('recorder', threads[0].name)
+        self.assertIsNot(threading.current_thread(), threads[0])
+
+    def test_slow_consumer_should_build_up_lag(self):
+        release = threading.Event()
+        subscriber = threaded.ThreadedSubscriber(lambda _: release.wait())
+        for i in range(5):
+            subscriber.put(i)
+        self.assertGreaterEqual(subscriber.lag, 4)
+        release.set()
+        subscriber.close()
+        self.assertEqual(0, subscriber.lag)
+
+    def test_consumer_errors_should_be_raised_on_close(self):
+        def failing_consumer(value):
+            raise KeyError(value)
+
+        subscriber = threaded.ThreadedSubscriber(failing_consumer)
+        subscriber.put(1)
+        with self.assertRaises(KeyError):
+            subscriber.close()
+
+    def test_put_after_close_should_raise(self):
+        subscriber = threaded.ThreadedSubscriber(lambda _: None)
+        subscriber.close()
+        with self.assertRaises(RuntimeError):
+            subscriber.put(1)
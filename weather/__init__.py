@@ -1,10 +1,29 @@
+import importlib
 
-from .core import weather_station
-from .core import WeatherState
-from .core import DataCollector
-from .core import BroadcastPipe
-from .measurements import WeatherReading
-from .measurements import WeatherCondition
 
+# Public names and the submodule that defines them. Submodules are only
+# imported on first attribute access so that `import weather` stays cheap
+# for callers that never touch the simulation engine (simpy).
+_EXPORTS = {'weather_station': 'core',
+            'WeatherState': 'core',
+            'DataCollector': 'core',
+            'BroadcastPipe': 'core',
+            'WeatherReading': 'measurements',
+            'WeatherCondition': 'measurements'}
 
+__all__ = sorted(_EXPORTS)
 
+
+def __getattr__(name):
+    try:
+        module_name = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module('.' + module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import bz2
+import gzip
+import json
+import lzma
+
+
+"""Codec name -> (compress, decompress). All of them release the GIL
+while (de)compressing, so a thread pool compresses chunks in parallel.
+Concatenated chunks form a valid multi-stream file for the codec's
+command line tool, e.g. `zcat sim_output.csv.gz`."""
+CODECS = {'gzip': (gzip.compress, gzip.decompress),
+          'bz2': (bz2.compress, bz2.decompress),
+          'lzma': (lzma.compress, lzma.decompress)}
+
+
+ChunkEntry = namedtuple('ChunkEntry', ['offset',
+                                       'length',
+                                       'count',
+                                       'first_station',
+                                       'last_station',
+                                       'start',
+                                       'end'])
+"""Where a chunk is in the output file and what it contains: readings of
+the stations first_station...last_station, by name, in the local_time
+range [start, end]"""
+
+BUFFERED_CHUNKS = 16
+"""Default number of chunks worth of readings ChunkedWriter buffers"""
+
+
+def index_file(output_file):
+    """Path of the chunk index belonging to output_file"""
+    return output_file + '.idx'
+
+
+class StationBuffer(object):
+    """Report lines of a station waiting to be written, and their
+    local_time range"""
+
+    __slots__ = ['lines', 'start', 'end']
+
+    def __init__(self):
+        self.lines = []
+        self.start = None
+        self.end = None
+
+    def add(self, line, local_time):
+        self.lines.append(line)
+        if self.start is None or local_time < self.start:
+            self.start = local_time
+        if self.end is None or local_time > self.end:
+            self.end = local_time
+
+
+class ChunkedWriter(object):
+    """Write readings as independently compressed chunks of report lines.
+
+    Lines are buffered per station, so that each chunk holds a range of
+    stations and a station query only reads the chunks of its range. A
+    station's buffer becomes a chunk of its own once it holds chunk_size
+    lines. Once all buffers together hold buffer_size lines, they are
+    packed, in order of station name, into chunks of up to chunk_size
+    lines. Within a station, lines keep the order they were put in; the
+    file as a whole is grouped by station rather than ordered by time.
+
+    Full chunks are compressed on a thread pool while readings keep
+    arriving and are written in order as they complete. On close an index
+    of the chunks is written next to the output file, see read_index.
+    """
+
+    def __init__(self,
+                 output_file,
+                 line_processor,
+                 chunk_size=10000,
+                 codec='gzip',
+                 workers=4,
+                 buffer_size=None):
+        """
+        Args:
+            output_file (string): path to the output file
+            line_processor (function WeatherReading -> String):
+                function to turn a reading into a line
+            chunk_size (int): maximum readings per chunk
+            codec (string): one of CODECS
+            workers (int): number of compression threads
+            buffer_size (int): readings buffered across all stations,
+                BUFFERED_CHUNKS chunks worth if None
+        """
+        if codec not in CODECS:
+            raise ValueError('Unknown codec {!r}, expected one of {}'.format(
+                                codec, ', '.join(sorted(CODECS))))
+        self.output_file = output_file
+        self.line_processor = line_processor
+        self.chunk_size = chunk_size
+        self.codec = codec
+        self.buffer_size = (BUFFERED_CHUNKS * chunk_size
+                            if buffer_size is None else buffer_size)
+        self._compress = CODECS[codec][0]
+        self._file = open(output_file, 'wb')
+        self._executor = ThreadPoolExecutor(workers)
+        # Bound the chunks in flight so a slow disk cannot exhaust memory
+        self._max_pending = 2 * workers
+        self._pending = deque()
+        self._entries = []
+        self._offset = 0
+        self._buffers = {}
+        self._buffered = 0
+
+    def put(self, reading):
+        station = reading.station
+        buffer = self._buffers.get(station)
+        if buffer is None:
+            buffer = self._buffers[station] = StationBuffer()
+        buffer.add(self.line_processor(reading) + '\n', reading.local_time)
+        self._buffered += 1
+        if len(buffer.lines) >= self.chunk_size:
+            del self._buffers[station]
+            self._buffered -= len(buffer.lines)
+            self._submit([(station, buffer)])
+        elif self._buffered >= self.buffer_size:
+            self._flush()
+
+    def run(self, queue):
+        """Simpy process writing the readings arriving on queue"""
+        while True:
+            msg = yield queue.get()
+            self.put(msg)
+
+    def _flush(self):
+        """Pack all buffers, in order of station name, into chunks"""
+        group = []
+        count = 0
+        for station, buffer in sorted(self._buffers.items()):
+            if group and count + len(buffer.lines) > self.chunk_size:
+                self._submit(group)
+                group = []
+                count = 0
+            group.append((station, buffer))
+            count += len(buffer.lines)
+        if group:
+            self._submit(group)
+        self._buffers = {}
+        self._buffered = 0
+
+    def _submit(self, group):
+        """Compress the lines of a group of (station, StationBuffer),
+        sorted by station, as one chunk"""
+        data = ''.join(line for _, buffer in group
+                       for line in buffer.lines).encode('utf-8')
+        future = self._executor.submit(self._compress, data)
+        self._pending.append((future,
+                              sum(len(buffer.lines) for _, buffer in group),
+                              group[0][0],
+                              group[-1][0],
+                              min(buffer.start for _, buffer in group),
+                              max(buffer.end for _, buffer in group)))
+        self._write_completed(wait=len(self._pending) > self._max_pending)
+
+    def _write_completed(self, wait):
+        """Write compressed chunks in order, as long as they are done.
+        With wait, block until at least the oldest chunk is written."""
+        while self._pending and (wait or self._pending[0][0].done()):
+            future, count, first, last, start, end = self._pending.popleft()
+            compressed = future.result()
+            self._file.write(compressed)
+            self._entries.append(ChunkEntry(self._offset,
+                                            len(compressed),
+                                            count,
+                                            first,
+                                            last,
+                                            start,
+                                            end))
+            self._offset += len(compressed)
+            wait = False
+
+    def close(self):
+        """Write the remaining readings and the index"""
+        self._flush()
+        while self._pending:
+            self._write_completed(wait=True)
+        self._executor.shutdown()
+        self._file.close()
+        with open(index_file(self.output_file), 'w') as f:
+            json.dump({'codec': self.codec,
+                       'chunks': [entry._asdict() for entry in self._entries]},
+                      f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_index(output_file):
+    """Read the chunk index of a file written by ChunkedWriter
+
+    Args:
+        output_file (string): path to the output file
+
+    Returns:
+        (string, list[ChunkEntry]): the codec and the chunks in file order
+    """
+    with open(index_file(output_file)) as f:
+        index = json.load(f)
+    return index['codec'], [ChunkEntry(**entry) for entry in index['chunks']]
+
+
+def read_lines(output_file, station=None, start=None, end=None):
+    """Read the lines of the chunks that may hold readings of a station
+    and time range. Only those chunks are read and decompressed; lines of
+    other stations and times sharing a chunk are included. Lines come in
+    file order: grouped by station, in time order within a station.
+
+    Args:
+        output_file (string): path to the output file
+        station (string): only chunks whose station range holds this
+            station, any if None
+        start (double): only chunks with readings at or after start
+        end (double): only chunks with readings at or before end
+
+    Returns:
+        (generator of string): lines, without line endings
+    """
+    codec, chunks = read_index(output_file)
+    decompress = CODECS[codec][1]
+    with open(output_file, 'rb') as f:
+        for chunk in chunks:
+            if station is not None and not \
+                    chunk.first_station <= station <= chunk.last_station:
+                continue
+            if start is not None and chunk.end < start:
+                continue
+            if end is not None and chunk.start > end:
+                continue
+            f.seek(chunk.offset)
+            data = decompress(f.read(chunk.length)).decode('utf-8')
+            for line in data.splitlines():
+                yield line
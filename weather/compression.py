@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+import heapq
+import struct
+
+from weather import core
+from weather import measurements
+
+
+class BitWriter(object):
+    """Append only stream of bits"""
+
+    def __init__(self):
+        self._bytes = bytearray()
+        self._acc = 0
+        self._nbits = 0
+
+    def __len__(self):
+        """Number of bits written"""
+        return 8 * len(self._bytes) + self._nbits
+
+    def write(self, value, nbits):
+        """Append the nbits lowest bits of value, most significant first"""
+        self._acc = (self._acc << nbits) | value
+        self._nbits += nbits
+        if self._nbits >= 64:
+            extra = self._nbits & 7
+            self._bytes += (self._acc >> extra).to_bytes(self._nbits >> 3, 'big')
+            self._acc &= (1 << extra) - 1
+            self._nbits = extra
+
+    def getvalue(self):
+        """The bits written so far, zero padded to whole bytes"""
+        pad = -self._nbits & 7
+        tail = (self._acc << pad).to_bytes((self._nbits + pad) >> 3, 'big')
+        return bytes(self._bytes) + tail
+
+
+class BitReader(object):
+    """Read bits in the order a BitWriter wrote them"""
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        self._acc = 0
+        self._nbits = 0
+
+    def read(self, nbits):
+        while self._nbits < nbits:
+            chunk = self._data[self._pos:self._pos + 8]
+            if not chunk:
+                raise EOFError('read past the end of the bit stream')
+            self._acc = (self._acc << (8 * len(chunk))) | int.from_bytes(chunk,
+                                                                         'big')
+            self._nbits += 8 * len(chunk)
+            self._pos += len(chunk)
+        self._nbits -= nbits
+        value = self._acc >> self._nbits
+        self._acc &= (1 << self._nbits) - 1
+        return value
+
+
+def zigzag(n):
+    """Map signed to unsigned integers: 0, -1, 1, -2 ... -> 0, 1, 2, 3 ..."""
+    return (n << 1) ^ (n >> 63)
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+"""(prefix, prefix length, value bits) for delta-of-delta timestamps,
+by increasing size. Values are zigzag encoded."""
+TIMESTAMP_BUCKETS = [(0b10, 2, 7),
+                     (0b110, 3, 9),
+                     (0b1110, 4, 12),
+                     (0b1111, 4, 64)]
+
+
+class TimestampEncoder(object):
+    """Delta-of-delta encoding of integer timestamps.
+    A fixed reporting interval costs a single bit per timestamp."""
+
+    def __init__(self):
+        self._prev = 0
+        self._prev_delta = 0
+
+    def encode(self, writer, timestamp):
+        if timestamp != int(timestamp):
+            raise ValueError('Only integer timestamps can be compressed, '
+                             'got {!r}'.format(timestamp))
+        timestamp = int(timestamp)
+        delta = timestamp - self._prev
+        dod = delta - self._prev_delta
+        self._prev, self._prev_delta = timestamp, delta
+        if dod == 0:
+            writer.write(0, 1)
+            return
+        value = zigzag(dod)
+        for prefix, prefix_bits, value_bits in TIMESTAMP_BUCKETS:
+            if value < 1 << value_bits:
+                writer.write(prefix, prefix_bits)
+                writer.write(value, value_bits)
+                return
+
+    def decode(self, reader):
+        if reader.read(1):
+            # Every further 1 bit of the prefix selects the next bucket
+            value_bits = TIMESTAMP_BUCKETS[-1][2]
+            for _, _, bucket_bits in TIMESTAMP_BUCKETS[:-1]:
+                if not reader.read(1):
+                    value_bits = bucket_bits
+                    break
+            dod = unzigzag(reader.read(value_bits))
+        else:
+            dod = 0
+        self._prev_delta += dod
+        self._prev += self._prev_delta
+        return self._prev
+
+
+_pack_double = struct.Struct('>d').pack
+_unpack_double = struct.Struct('>d').unpack
+_pack_bits = struct.Struct('>Q').pack
+_unpack_bits = struct.Struct('>Q').unpack
+
+
+class FloatEncoder(object):
+    """XOR encoding of doubles against the previous value. Unchanged values
+    cost a bit, slowly changing values only their differing middle bits."""
+
+    def __init__(self):
+        self._prev = None
+        self._leading = -1
+        self._trailing = 0
+
+    def encode(self, writer, value):
+        bits = _unpack_bits(_pack_double(value))[0]
+        prev, self._prev = self._prev, bits
+        if prev is None:
+            writer.write(bits, 64)
+            return
+        xor = bits ^ prev
+        if xor == 0:
+            writer.write(0, 1)
+            return
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if (self._leading >= 0 and leading >= self._leading and
+                trailing >= self._trailing):
+            # Fits the window of meaningful bits of the previous value
+            writer.write(0b10, 2)
+            writer.write(xor >> self._trailing,
+                         64 - self._leading - self._trailing)
+        else:
+            meaningful = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(meaningful - 1, 6)
+            writer.write(xor >> trailing, meaningful)
+            self._leading, self._trailing = leading, trailing
+
+    def decode(self, reader):
+        if self._prev is None:
+            self._prev = reader.read(64)
+        elif reader.read(1):
+            if reader.read(1):
+                self._leading = reader.read(5)
+                meaningful = reader.read(6) + 1
+                self._trailing = 64 - self._leading - meaningful
+            else:
+                meaningful = 64 - self._leading - self._trailing
+            self._prev ^= reader.read(meaningful) << self._trailing
+        return _unpack_double(_pack_bits(self._prev))[0]
+
+
+class StationSeries(object):
+    """The compressed readings of a single station.
+
+    The station's name and location are stored once. Per reading,
+    local_time is delta-of-delta encoded, temperature, pressure and humidity
+    are XOR encoded into a single bit stream and the conditions are run
+    length encoded.
+    """
+
+    def __init__(self, reading):
+        self.station = reading.station
+        self.location = (reading.latitude, reading.longitude, reading.altitude)
+        self.count = 0
+        self._bits = BitWriter()
+        self._time = TimestampEncoder()
+        self._values = [FloatEncoder(), FloatEncoder(), FloatEncoder()]
+        self._conditions = array('B')
+        self._runs = array('L')
+
+    @property
+    def nbytes(self):
+        """Bytes used by the encoded data"""
+        return ((len(self._bits) + 7) // 8 +
+                self._conditions.itemsize * len(self._conditions) +
+                self._runs.itemsize * len(self._runs))
+
+    def append(self, reading):
+        if (reading.latitude, reading.longitude, reading.altitude) != \
+                self.location:
+            raise ValueError('Station {} moved'.format(self.station))
+        bits = self._bits
+        self._time.encode(bits, reading.local_time)
+        temperature, pressure, humidity = self._values
+        temperature.encode(bits, reading.temperature)
+        pressure.encode(bits, reading.pressure)
+        humidity.encode(bits, reading.humidity)
+        code = reading.conditions.value
+        if self._conditions and self._conditions[-1] == code:
+            self._runs[-1] += 1
+        else:
+            self._conditions.append(code)
+            self._runs.append(1)
+        self.count += 1
+
+    def __iter__(self):
+        """Decode the readings appended so far, one at a time"""
+        reader = BitReader(self._bits.getvalue())
+        time = TimestampEncoder()
+        temperature, pressure, humidity = [FloatEncoder() for _ in range(3)]
+        latitude, longitude, altitude = self.location
+        conditions = [measurements.WeatherCondition(code)
+                      for code in self._conditions]
+        for condition, run in zip(conditions, self._runs):
+            for _ in range(run):
+                yield measurements.WeatherReading(self.station,
+                                                  latitude,
+                                                  longitude,
+                                                  altitude,
+                                                  time.decode(reader),
+                                                  condition,
+                                                  temperature.decode(reader),
+                                                  pressure.decode(reader),
+                                                  humidity.decode(reader))
+
+
+class CompressedCollector(object):
+    """A DataCollector backend keeping every station's readings as a
+    compressed StationSeries instead of a list of WeatherReadings.
+
+    Readings are decoded on iteration, ordered by local_time, then by their
+    position in their station's series and then by the order in which
+    stations first reported. For stations reporting on a shared schedule
+    that is the order they were collected in.
+    Temperature, pressure and humidity are decoded as floats.
+    Like a DataCollector, it only collects through put if msg_queue is None.
+    """
+
+    def __init__(self, environment, msg_queue):
+        self.queue = msg_queue
+        self._series = {}
+        if msg_queue is not None:
+            environment.process(self.run())
+
+    @property
+    def data(self):
+        """All readings, decoded into a list"""
+        return list(self)
+
+    @property
+    def footprint(self):
+        """Bytes used by the encoded readings"""
+        return sum(series.nbytes for series in self._series.values())
+
+    def __len__(self):
+        return sum(series.count for series in self._series.values())
+
+    def __iter__(self):
+        def keyed(order, series):
+            for i, reading in enumerate(series):
+                yield reading.local_time, i, order, reading
+
+        streams = [keyed(order, series)
+                   for order, series in enumerate(self._series.values())]
+        for _, _, _, reading in heapq.merge(*streams):
+            yield reading
+
+    def put(self, value):
+        series = self._series.get(value.station)
+        if series is None:
+            series = self._series[value.station] = StationSeries(value)
+        series.append(value)
+
+    def readings_for_station(self, station):
+        """All readings of a station in time order
+
+        Args:
+            station (string): the station name
+
+        Returns:
+            (list[WeatherReading])
+        """
+        series = self._series.get(station)
+        return list(series) if series is not None else []
+
+    def compression_ratio(self):
+        """Estimated bytes of the readings held uncompressed by a
+        DataCollector, divided by the bytes used here"""
+        footprint = self.footprint
+        if not footprint:
+            return 1.0
+        sample = next(iter(self._series.values()))
+        reading = next(iter(sample))
+        return len(self) * core.estimate_record_size(reading) / float(footprint)
+
+    def run(self):
+        while True:
+            msg = yield self.queue.get()
+            self.put(msg)
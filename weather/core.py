@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
 
+from array import array
+import bisect
+import heapq
+import os
 import simpy
+import sys
 from collections import namedtuple
+from weather import spatial
 
 
 WeatherState = namedtuple('WeatherState', ['transformer', 'weather'])
@@ -44,17 +50,23 @@ class BroadcastPipe(object):
     """A Broadcast pipe that allows one process to send messages to many.
     Frome the Simpy documentation and hence not tested directly:
         http://simpy.readthedocs.io/en/latest/examples/process_communication.html
+
+    Besides simpy stores, consumers can subscribe to be fed from a ring
+    buffer on their own thread, see subscribe.
     """
 
     def __init__(self, environment, capacity=simpy.core.Infinity):
         self.environment = environment
         self.capacity = capacity
         self.pipes = []
+        self.subscribers = []
 
     def put(self, value):
         """Broadcast a *value* to all receivers."""
-        if not self.pipes:
+        if not self.pipes and not self.subscribers:
             raise RuntimeError('There are no output pipes.')
+        for subscriber in self.subscribers:
+            subscriber.put(value)
         events = [store.put(value) for store in self.pipes]
         # Condition event for all "events"
         return self.environment.all_of(events)
@@ -70,24 +82,318 @@ class BroadcastPipe(object):
         self.pipes.append(pipe)
         return pipe
 
+    def subscribe(self, consumer, capacity=65536, name=None):
+        """Call consumer with every message on a worker thread, fed through
+        a preallocated ring buffer, so its processing time overlaps with the
+        simulation instead of adding to it. Call close to drain.
+
+        Args:
+            consumer (function A -> None): processes a message
+            capacity (int): size of the ring buffer
+            name (string): name of the subscriber
+
+        Returns:
+            (threaded.ThreadedSubscriber): the subscriber, with lag metrics
+        """
+        from weather import threaded
+        subscriber = threaded.ThreadedSubscriber(consumer, capacity, name)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def close(self):
+        """Wait for all subscribers to process their messages
+
+        Returns:
+            (list[dict]): the metrics of every subscriber
+        """
+        errors = []
+        for subscriber in self.subscribers:
+            try:
+                subscriber.close()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+        return [subscriber.metrics() for subscriber in self.subscribers]
+
 
 class DataCollector(object):
     """Collect records during the simulation from the msg_queue
     and make them available after the run
+
+    Records with a station (i.e. WeatherReadings) are also indexed by
+    station location and by station and time, so per-station, time range,
+    per-day and regional queries do not need to scan all the data.
+
+    Given a memory_limit, the oldest records are spilled to temporary
+    on-disk segments whenever the estimated footprint of the records and
+    indexes held in memory exceeds it. Spilled records are loaded back
+    lazily when iterating over the collector or querying. The indexes,
+    INDEX_ENTRY_SIZE bytes per reading, always stay in memory and count
+    towards the limit, so the limit holds as long as they fit within it.
+    Segments hold at least MIN_SEGMENT_RECORDS records.
     """
-    def __init__(self, environment, msg_queue):
+    def __init__(self, environment, msg_queue, memory_limit=None):
+        """
+        Args:
+            environment (simpy.Environment)
+            msg_queue (simpy.Store): the queue to collect records from,
+                if None records are only collected by calling put
+            memory_limit (int): bytes of records to hold in memory,
+                unlimited if None
+        """
         self.queue = msg_queue
+        self.memory_limit = memory_limit
+        # records not spilled, self._data[0] is at position self._spilled
         self._data = []
-        environment.process(self.run())
+        self._spilled = 0
+        self._record_size = None
+        # first position and path of every spilled segment, in order
+        self._segment_starts = []
+        self._segments = []
+        self._spill_dir = None
+        self._loaded_segment = (None, None)
+        # station -> StationIndex of the positions of its readings
+        self._by_station = {}
+        self._stations = spatial.GridIndex()
+        self._index_size = 0
+        if msg_queue is not None:
+            environment.process(self.run())
 
     @property
     def data(self):
-        return self._data
+        """All records, loading spilled segments back into memory"""
+        if not self._segments:
+            return self._data
+        return list(self)
+
+    @property
+    def footprint(self):
+        """Estimated bytes of the records and indexes held in memory"""
+        return len(self._data) * (self._record_size or 0) + self._index_size
+
+    def __len__(self):
+        return self._spilled + len(self._data)
+
+    def __iter__(self):
+        """Iterate over all records, loading spilled segments one at a time"""
+        for path in self._segments:
+            for record in load_segment(path):
+                yield record
+        for record in self._data:
+            yield record
 
     def put(self, value):
+        position = len(self)
+        station = getattr(value, 'station', None)
+        if station is not None:
+            self._index(station, value, position)
         self._data.append(value)
+        if self.memory_limit is not None:
+            if self._record_size is None:
+                self._record_size = estimate_record_size(value)
+            if (self.footprint > self.memory_limit and
+                    len(self._data) >= MIN_SEGMENT_RECORDS):
+                self._spill()
+
+    def _spill(self):
+        """Move the older half of the records in memory, but at least
+        MIN_SEGMENT_RECORDS, to a segment"""
+        # Only runs that spill pay for these imports
+        import pickle
+        if self._spill_dir is None:
+            import shutil
+            import tempfile
+            import weakref
+            self._spill_dir = tempfile.mkdtemp(prefix='weathersim-')
+            weakref.finalize(self, shutil.rmtree, self._spill_dir,
+                             ignore_errors=True)
+        count = min(len(self._data),
+                    max(MIN_SEGMENT_RECORDS, len(self._data) // 2))
+        path = os.path.join(self._spill_dir,
+                            'segment-{:06d}.pickle'.format(len(self._segments)))
+        with open(path, 'wb') as f:
+            pickle.dump(self._data[:count], f, pickle.HIGHEST_PROTOCOL)
+        self._segment_starts.append(self._spilled)
+        self._segments.append(path)
+        del self._data[:count]
+        self._spilled += count
+
+    def _readings_at(self, positions):
+        """The records at positions, loading spilled segments as needed.
+        At most one segment is held at a time, and none once this returns.
+        """
+        try:
+            return [self._reading_at(i) for i in positions]
+        finally:
+            self._loaded_segment = (None, None)
+
+    def _reading_at(self, position):
+        if position >= self._spilled:
+            return self._data[position - self._spilled]
+        i = bisect.bisect_right(self._segment_starts, position) - 1
+        path = self._segments[i]
+        loaded_path, records = self._loaded_segment
+        if loaded_path != path:
+            records = load_segment(path)
+            self._loaded_segment = (path, records)
+        return records[position - self._segment_starts[i]]
+
+    def _index(self, station, reading, position):
+        station_index = self._by_station.get(station)
+        if station_index is None:
+            station_index = self._by_station[station] = StationIndex()
+            self._stations.insert(station,
+                                  reading.latitude,
+                                  reading.longitude)
+            self._index_size += STATION_INDEX_SIZE
+        local_time = reading.local_time
+        station_index.add(local_time, position)
+        self._index_size += INDEX_ENTRY_SIZE
+
+    def readings_for_station(self, station):
+        """All readings of a station in time order
+
+        Args:
+            station (string): the station name
+
+        Returns:
+            (list[WeatherReading])
+        """
+        return self.readings_between(station, float('-inf'), float('inf'))
+
+    def readings_between(self, station, start, end):
+        """Readings of a station with start <= local_time < end,
+        in time order
+
+        Args:
+            station (string): the station name
+            start (double): start of the time range, inclusive
+            end (double): end of the time range, exclusive
+
+        Returns:
+            (list[WeatherReading])
+        """
+        station_index = self._by_station.get(station)
+        if station_index is None:
+            return []
+        return self._readings_at(station_index.between(start, end))
+
+    def latest_reading(self, station):
+        """The reading of a station with the latest local_time
+
+        Args:
+            station (string): the station name
+
+        Returns:
+            (WeatherReading): None if the station has no readings
+        """
+        station_index = self._by_station.get(station)
+        if station_index is None:
+            return None
+        return self._readings_at(station_index.positions[-1:])[0]
+
+    def readings_on_day(self, day):
+        """Readings of all stations with day <= local_time < day + 1,
+        in the order they were collected
+
+        Args:
+            day (int): the day
+
+        Returns:
+            (list[WeatherReading])
+        """
+        positions = heapq.merge(*[sorted(index.between(day, day + 1))
+                                  for index in self._by_station.values()])
+        return self._readings_at(positions)
+
+    def readings_in_region(self, region):
+        """All readings of stations within a region,
+        in the order they were collected
+
+        Args:
+            region (spatial.BoundingBox or spatial.Circle)
+
+        Returns:
+            (list[WeatherReading])
+        """
+        stations = self._stations.query(region)
+        positions = heapq.merge(*[sorted(self._by_station[s].positions)
+                                  for s in stations])
+        return self._readings_at(positions)
 
     def run(self):
         while True:
             msg = yield self.queue.get()
             self.put(msg)
+
+
+"""Records per spilled segment at least, so a tiny memory_limit does not
+write a file per record"""
+MIN_SEGMENT_RECORDS = 1024
+
+"""Bytes of index per collected reading: its time and position
+in the StationIndex"""
+INDEX_ENTRY_SIZE = 2 * 8
+
+"""Approximate bytes of index per station"""
+STATION_INDEX_SIZE = 2 * sys.getsizeof(array('q')) + 200
+
+
+def load_segment(path):
+    """Load the records of a segment spilled by DataCollector"""
+    import pickle
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def estimate_record_size(record):
+    """Estimate the bytes held in memory by a collected record
+
+    Counts the record, its float and tuple fields, which are created per
+    reading, and its slot in the collector. Strings and enums are shared
+    between readings and are not counted.
+
+    Args:
+        record (WeatherReading or EnsembleSummary)
+
+    Returns:
+        (int): bytes
+    """
+    return _fields_size(record) + 8
+
+
+def _fields_size(value):
+    """Bytes of a float, or of a tuple and its float and tuple fields"""
+    if isinstance(value, float):
+        return sys.getsizeof(value)
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(_fields_size(field)
+                                          for field in value)
+    return 0
+
+
+class StationIndex(object):
+    """Positions of a station's readings, sorted by local_time.
+    Readings arrive in time order during a simulation, so adding is
+    usually an append; out of order readings are inserted in place.
+    """
+
+    def __init__(self):
+        self.times = array('d')
+        self.positions = array('q')
+
+    def add(self, local_time, position):
+        if self.times and local_time < self.times[-1]:
+            i = bisect.bisect_right(self.times, local_time)
+            self.times.insert(i, local_time)
+            self.positions.insert(i, position)
+        else:
+            self.times.append(local_time)
+            self.positions.append(position)
+
+    def between(self, start, end):
+        """Positions of readings with start <= local_time < end"""
+        lo = bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_left(self.times, end)
+        return self.positions[lo:hi]
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+import math
+import random
+
+from weather import helpers
+from weather import measurements
+
+
+EnsembleSummary = namedtuple('EnsembleSummary', ['station',
+                                                 'latitude',
+                                                 'longitude',
+                                                 'altitude',
+                                                 'local_time',
+                                                 'members',
+                                                 'temperature',
+                                                 'pressure',
+                                                 'humidity',
+                                                 'conditions'])
+"""Summary of all ensemble members of a station at a point in time.
+temperature, pressure and humidity hold the values at the requested
+percentiles, conditions the probability of every WeatherCondition,
+indexed by the value of the condition."""
+
+
+def percentile(sorted_values, q):
+    """Percentile by linear interpolation between the closest ranks
+
+    Args:
+        sorted_values (list[double]): non empty, in ascending order
+        q (double): percentile 0...100
+
+    Returns:
+        (double)
+    """
+    rank = (len(sorted_values) - 1) * q / 100.0
+    lower = int(math.floor(rank))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = rank - lower
+    return (sorted_values[lower] * (1 - fraction) +
+            sorted_values[upper] * fraction)
+
+
+def build_ensemble(environment,
+                   record,
+                   members,
+                   percentiles,
+                   temperature_sigma,
+                   pressure_sigma,
+                   humidity_range=(20, 100)):
+    """Build the transformer and initial summary of a station simulating
+    many members, i.e. independent random realisations, at once.
+
+    The deterministic baselines (the seasonal temperature of the day, the
+    pressure at the station's altitude) are computed once per tick for all
+    members; the members only differ by their random variation. The
+    per-member state, the previous pressure, is kept in a list.
+
+    Without numpy there is no array arithmetic: every member is still drawn
+    and classified in Python, at about the cost of one fused reading. An
+    ensemble saves the simpy events, collected records and output lines of
+    K separate readings, and the K processes of separate runs.
+
+    Args:
+        environment (simpy.Environment): Containter for the simulation
+        record (dict): a line from the stations file
+        members (int): number of ensemble members
+        percentiles (list[double]): percentiles to summarise, 0...100
+        temperature_sigma (double): relative standard deviation of
+            the temperature variation
+        pressure_sigma (double): relative standard deviation of
+            the pressure variation
+        humidity_range ((double, double)): humidity is uniform in this range
+
+    Returns:
+        ((function (EnsembleSummary) -> EnsembleSummary), EnsembleSummary):
+            a WeatherState for core.weather_station
+    """
+    if members < 1:
+        raise ValueError('An ensemble needs at least one member')
+    hottest_day = float(record['hottest_day'])
+    low_temp = float(record['low_temp'])
+    high_temp = float(record['high_temp'])
+    altitude = float(record['altitude'])
+    base_pressure = helpers.pressure(altitude)
+    humidity_low, humidity_high = humidity_range
+    number_of_conditions = len(measurements.WeatherCondition)
+    sunny = measurements.WeatherCondition.Sunny.value
+    clouds = measurements.WeatherCondition.Clouds.value
+    rain = measurements.WeatherCondition.Rain.value
+    snow = measurements.WeatherCondition.Snow.value
+    gauss = random.gauss
+    uniform = random.uniform
+    member_range = range(members)
+
+    def summarise(values):
+        values = sorted(values)
+        return tuple(percentile(values, q) for q in percentiles)
+
+    def summary(local_time, temperatures, pressures, humidities, counts):
+        return EnsembleSummary(record['station'],
+                               float(record['latitude']),
+                               float(record['longitude']),
+                               altitude,
+                               local_time,
+                               members,
+                               summarise(temperatures),
+                               summarise(pressures),
+                               summarise(humidities),
+                               tuple(count / float(members)
+                                     for count in counts))
+
+    def draw(local_time):
+        seasonal = helpers.temperature(local_time,
+                                       hottest_day,
+                                       low_temp,
+                                       high_temp)
+        temperatures = [seasonal * gauss(1, temperature_sigma)
+                        for _ in member_range]
+        pressures = [base_pressure * gauss(1, pressure_sigma)
+                     for _ in member_range]
+        humidities = [uniform(humidity_low, humidity_high)
+                      for _ in member_range]
+        return temperatures, pressures, humidities
+
+    temperatures, previous_pressures, humidities = draw(environment.now)
+    counts = [0] * number_of_conditions
+    counts[sunny] = members
+    initial = summary(environment.now, temperatures, previous_pressures,
+                      humidities, counts)
+
+    def transformer(previous_summary):
+        nonlocal previous_pressures
+        local_time = environment.now
+        temperatures, pressures, humidities = draw(local_time)
+        counts = [0] * number_of_conditions
+        # Inlined helpers.weather_condition for every member
+        for t, curr, prev in zip(temperatures, pressures, previous_pressures):
+            delta = curr - prev
+            if -10 < delta <= 10:
+                counts[sunny] += 1
+            elif delta < -10:
+                counts[snow if t < 0 else rain] += 1
+            else:
+                counts[clouds] += 1
+        previous_pressures = pressures
+        return summary(local_time, temperatures, pressures, humidities, counts)
+
+    return transformer, initial
+
+
+def ensemble_summary_to_report_line(summary, sep):
+    """Generate a report line given an EnsembleSummary:
+    station, local_time, members, the temperature, pressure and humidity
+    percentiles and the probability of each WeatherCondition
+
+    Args:
+        summary (EnsembleSummary)
+        sep (string): seperator
+
+    Returns:
+        (string): a line
+    """
+    data = [summary.station, str(summary.local_time), str(summary.members)]
+    for values in [summary.temperature,
+                   summary.pressure,
+                   summary.humidity,
+                   summary.conditions]:
+        data.extend(str(v) for v in values)
+    return sep.join(data)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import math
+import random
+
+
+class SharedField(object):
+    """Standard normal noise on a coarse latitude/longitude grid,
+    redrawn every simulation tick and sampled at station locations by
+    bilinear interpolation. Stations sharing grid nodes see correlated
+    values, and each extra station costs an interpolation rather than
+    an independent draw.
+
+    Grid nodes are drawn lazily, so only nodes next to a station are
+    ever generated.
+    """
+
+    def __init__(self, environment, resolution=5.0, gauss=random.gauss):
+        """
+        Args:
+            environment (simpy.Environment): provides the current tick
+            resolution (double): grid spacing in degrees, must divide 360
+                so the grid wraps around the antimeridian
+            gauss (function (double, double) -> double):
+                source of normally distributed values
+        """
+        columns = int(round(360.0 / resolution)) if resolution > 0 else 0
+        if columns < 1 or not math.isclose(columns * resolution, 360.0):
+            raise ValueError('Field resolution {!r} does not divide 360 '
+                             'degrees'.format(resolution))
+        self.environment = environment
+        self.resolution = resolution
+        self._gauss = gauss
+        self._columns = columns
+        self._tick = None
+        self._nodes = {}
+
+    def sampler(self, latitude, longitude):
+        """Build a function sampling the field at a fixed location.
+        The interpolation weights are computed once, here.
+
+        Args:
+            latitude (double): degrees
+            longitude (double): degrees
+
+        Returns:
+            (function: () -> double): the standard normal field value
+                at the location for the current tick
+        """
+        y = latitude / self.resolution
+        x = longitude / self.resolution
+        row, column = int(math.floor(y)), int(math.floor(x))
+        dy, dx = y - row, x - column
+        weights = [((row, column), (1 - dy) * (1 - dx)),
+                   ((row, column + 1), (1 - dy) * dx),
+                   ((row + 1, column), dy * (1 - dx)),
+                   ((row + 1, column + 1), dy * dx)]
+        # Wrap longitudes so stations either side of the antimeridian
+        # share nodes, and drop nodes that do not contribute
+        weights = [((r, c % self._columns), w) for (r, c), w in weights if w]
+        # Interpolating iid nodes shrinks the variance towards a cell's
+        # centre, rescale so every location has unit variance
+        norm = math.sqrt(sum(w * w for _, w in weights))
+        weights = [(node, w / norm) for node, w in weights]
+        node = self._node
+
+        def sample():
+            return sum(w * node(n) for n, w in weights)
+
+        return sample
+
+    def _node(self, node):
+        now = self.environment.now
+        if now != self._tick:
+            self._tick = now
+            self._nodes = {}
+        value = self._nodes.get(node)
+        if value is None:
+            value = self._nodes[node] = self._gauss(0, 1)
+        return value
+
+
+def build_variation(field, latitude, longitude, sigma):
+    """Build a variation function, like run_sim.temperature_variation,
+    whose randomness comes from a SharedField
+
+    Args:
+        field (SharedField): the shared noise
+        latitude (double): station latitude in degrees
+        longitude (double): station longitude in degrees
+        sigma (double): relative standard deviation of the variation
+
+    Returns:
+        (function (double) -> double): scales a value by
+            1 + sigma * field value at the station
+    """
+    sample = field.sampler(latitude, longitude)
+
+    def variation(value):
+        return value * (1 + sigma * sample())
+
+    return variation
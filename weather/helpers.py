@@ -1,8 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from statistics import mean
 from weather import measurements
-import csv
 import functools
 import math
 import random
@@ -34,7 +32,7 @@ def write_data(data, output_file, line_processor):
     """Write data to file
 
     Args:
-        data (list[A]): the data to be written to file
+        data (iterable[A]): the data to be written to file
         output_file (string): path to output file
         line_processor (function A -> String):
             function to turn a data element into a string
@@ -54,6 +52,7 @@ def read_csv_file(data_file):
     Returns:
         (list(dict)): data in the file
     """
+    import csv
     with open(data_file) as f:
         reader = csv.DictReader(f)
         return [rec for rec in reader]
@@ -110,6 +109,80 @@ def build_transformer(environment,
     return transformer
 
 
+def build_fused_transformer(environment,
+                            hottest_day,
+                            low_temp,
+                            high_temp,
+                            altitude,
+                            temperature_sigma,
+                            pressure_sigma,
+                            humidity_range=(20, 100)):
+    """Build a transformer equivalent to build_transformer wired with
+    build_temperature_updater, a varied pressure, weather_condition and
+    humidity_updater, as one flat function.
+
+    Everything that only depends on the station (seasonal curve constants,
+    the pressure at its altitude) is computed here, so a transition is a
+    single call with no intermediate function calls. Randomness is drawn in
+    the same order as the composed transformer: temperature, pressure and
+    then humidity. Use build_transformer for other updaters.
+
+    Args:
+        environment (simpy.Environment): Containter for the simulation
+        hottest_day (int): day with hottest average temperature 0...364
+        low_temp (double): lowest average temperature for a day
+        high_temp (double): highest average temperature for a day
+        altitude (double): height of the station above sealevel in meters
+        temperature_sigma (double): relative standard deviation of
+            the temperature variation
+        pressure_sigma (double): relative standard deviation of
+            the pressure variation
+        humidity_range ((double, double)): humidity is uniform in this range
+
+    Returns:
+        (function (WeatherReading) -> WeatherReading):
+            given the previous WeatherReading calculate
+            the current WeatherReading
+    """
+    average_temp = (low_temp + high_temp) / 2.0
+    amplitude = average_temp - low_temp
+    omega = 2 * math.pi / 365
+    base_pressure = pressure(altitude)
+    humidity_low, humidity_high = humidity_range
+    cos = math.cos
+    gauss = random.gauss
+    uniform = random.uniform
+    reading = measurements.WeatherReading
+    sunny = measurements.WeatherCondition.Sunny
+    clouds = measurements.WeatherCondition.Clouds
+    rain = measurements.WeatherCondition.Rain
+    snow = measurements.WeatherCondition.Snow
+
+    def transformer(weather_reading):
+        local_time = environment.now
+        temperature = ((amplitude * cos(omega * (local_time - hottest_day)) +
+                        average_temp) * gauss(1, temperature_sigma))
+        curr_pressure = base_pressure * gauss(1, pressure_sigma)
+        # Inlined weather_condition
+        delta = curr_pressure - weather_reading.pressure
+        if -10 < delta <= 10:
+            conditions = sunny
+        elif delta < -10:
+            conditions = snow if temperature < 0 else rain
+        else:
+            conditions = clouds
+        return reading(weather_reading.station,
+                       weather_reading.latitude,
+                       weather_reading.longitude,
+                       weather_reading.altitude,
+                       local_time,
+                       conditions,
+                       temperature,
+                       curr_pressure,
+                       uniform(humidity_low, humidity_high))
+    return transformer
+
+
 """No arg function to get a humidity reading """
 humidity_updater = functools.partial(random.uniform, 20, 100)
 
@@ -129,7 +202,7 @@ def temperature(day_of_year, hottest_day, low_temp, high_temp):
     Returns:
         (double): expected temperature for day_of_year
     """
-    average_temp = mean([low_temp, high_temp])
+    average_temp = (low_temp + high_temp) / 2.0
     amplitude = average_temp - low_temp
     return amplitude * math.cos((2 * math.pi / 365) *
                                 (day_of_year - hottest_day)) + average_temp
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+import bisect
+import math
+import operator
+
+from weather import measurements
+
+
+"""The numeric WeatherReading fields that are aggregated. Latitude,
+longitude and altitude are constant per station and local_time is
+summarised by the window itself."""
+ROLLUP_FIELDS = ['temperature', 'pressure', 'humidity']
+_rollup_values = operator.attrgetter(*ROLLUP_FIELDS)
+
+
+FieldSummary = namedtuple('FieldSummary', ['minimum', 'maximum', 'mean'])
+
+
+Rollup = namedtuple('Rollup', ['station',
+                               'start',
+                               'end',
+                               'count',
+                               'temperature',
+                               'pressure',
+                               'humidity',
+                               'conditions'])
+"""Aggregate of a station's readings with start <= local_time < end.
+temperature, pressure and humidity are FieldSummaries, conditions the
+number of readings per WeatherCondition, indexed by its value."""
+
+
+DAYS_PER_YEAR = 365
+MONTH_STARTS = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334, 365]
+
+
+def daily_window(local_time):
+    """The (start, end) days of the day containing local_time"""
+    day = int(math.floor(local_time))
+    return day, day + 1
+
+
+def monthly_window(local_time):
+    """The (start, end) days of the month containing local_time,
+    for years of 365 days starting at day 0"""
+    year, day_of_year = divmod(int(math.floor(local_time)), DAYS_PER_YEAR)
+    month = bisect.bisect_right(MONTH_STARTS, day_of_year) - 1
+    offset = year * DAYS_PER_YEAR
+    return offset + MONTH_STARTS[month], offset + MONTH_STARTS[month + 1]
+
+
+def yearly_window(local_time):
+    """The (start, end) days of the year containing local_time"""
+    year = int(math.floor(local_time)) // DAYS_PER_YEAR
+    return year * DAYS_PER_YEAR, (year + 1) * DAYS_PER_YEAR
+
+
+TIERS = {'daily': daily_window,
+         'monthly': monthly_window,
+         'yearly': yearly_window}
+
+
+def rollup_file(output_file, tier):
+    """Path of the rollup file of a tier belonging to output_file"""
+    return '{}.{}.csv'.format(output_file, tier)
+
+
+class Aggregate(object):
+    """Running count, min, max and sum per field and condition counts
+    of a station's readings in a window"""
+
+    __slots__ = ['station', 'window', 'count', 'minimum', 'maximum', 'total',
+                 'conditions']
+
+    def __init__(self, station, window):
+        self.station = station
+        self.window = window
+        self.count = 0
+        self.minimum = [math.inf] * len(ROLLUP_FIELDS)
+        self.maximum = [-math.inf] * len(ROLLUP_FIELDS)
+        self.total = [0.0] * len(ROLLUP_FIELDS)
+        self.conditions = [0] * len(measurements.WeatherCondition)
+
+    def add(self, reading):
+        self.count += 1
+        for i, value in enumerate(_rollup_values(reading)):
+            if value < self.minimum[i]:
+                self.minimum[i] = value
+            if value > self.maximum[i]:
+                self.maximum[i] = value
+            self.total[i] += value
+        self.conditions[reading.conditions.value] += 1
+
+    def to_rollup(self):
+        start, end = self.window
+        summaries = [FieldSummary(self.minimum[i],
+                                  self.maximum[i],
+                                  self.total[i] / self.count)
+                     for i in range(len(ROLLUP_FIELDS))]
+        return Rollup(self.station, start, end, self.count,
+                      *summaries, conditions=tuple(self.conditions))
+
+
+def rollup_to_report_line(rollup, sep):
+    """Generate a report line given a Rollup:
+    station, start, end, count, min, max and mean of every field in
+    ROLLUP_FIELDS and the count of every WeatherCondition
+
+    Args:
+        rollup (Rollup)
+        sep (string): seperator
+
+    Returns:
+        (string): a line
+    """
+    data = [rollup.station, str(rollup.start), str(rollup.end),
+            str(rollup.count)]
+    for summary in [rollup.temperature, rollup.pressure, rollup.humidity]:
+        data.extend(str(v) for v in summary)
+    data.extend(str(c) for c in rollup.conditions)
+    return sep.join(data)
+
+
+def report_line_to_rollup(line, sep):
+    """Parse a line written by rollup_to_report_line
+
+    Args:
+        line (string): a line
+        sep (string): seperator
+
+    Returns:
+        (Rollup)
+    """
+    fields = line.rstrip('\n').split(sep)
+    station, start, end, count = fields[:4]
+    values = [float(v) for v in fields[4:4 + 3 * len(ROLLUP_FIELDS)]]
+    summaries = [FieldSummary(*values[i:i + 3])
+                 for i in range(0, len(values), 3)]
+    conditions = tuple(int(c) for c in fields[4 + 3 * len(ROLLUP_FIELDS):])
+    return Rollup(station, int(start), int(end), int(count),
+                  *summaries, conditions=conditions)
+
+
+class RollupWriter(object):
+    """Maintain aggregates per station and tier while readings arrive and
+    write every window, once closed, to the tier's rollup file, so
+    aggregate queries never need the raw readings.
+
+    A window closes when a station reports a reading in a later window of
+    the tier, or on close. Readings of a station are expected in time order.
+    """
+
+    def __init__(self, output_file, tiers=('daily', 'monthly', 'yearly'),
+                 sep='|'):
+        """
+        Args:
+            output_file (string): the simulation output file, rollups are
+                written next to it, see rollup_file
+            tiers (list[string]): names of the TIERS to maintain
+            sep (string): seperator of the rollup files
+        """
+        unknown = [tier for tier in tiers if tier not in TIERS]
+        if unknown:
+            raise ValueError('Unknown rollup tiers {}, expected some of {}'
+                             .format(', '.join(unknown),
+                                     ', '.join(sorted(TIERS))))
+        self.sep = sep
+        self._tiers = [(TIERS[tier], {}, open(rollup_file(output_file, tier),
+                                              'w'))
+                       for tier in tiers]
+
+    def put(self, reading):
+        station = reading.station
+        local_time = reading.local_time
+        for window_of, aggregates, f in self._tiers:
+            aggregate = aggregates.get(station)
+            if aggregate is None or not \
+                    aggregate.window[0] <= local_time < aggregate.window[1]:
+                if aggregate is not None:
+                    self._write(f, aggregate)
+                aggregate = aggregates[station] = Aggregate(
+                                                    station,
+                                                    window_of(local_time))
+            aggregate.add(reading)
+
+    def run(self, queue):
+        """Simpy process aggregating the readings arriving on queue"""
+        while True:
+            msg = yield queue.get()
+            self.put(msg)
+
+    def _write(self, f, aggregate):
+        f.write(rollup_to_report_line(aggregate.to_rollup(), self.sep) + '\n')
+
+    def close(self):
+        """Write the windows still open and close the rollup files"""
+        for _, aggregates, f in self._tiers:
+            for aggregate in aggregates.values():
+                self._write(f, aggregate)
+            aggregates.clear()
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_rollups(output_file, tier, station=None, sep='|'):
+    """Read the rollups of a tier
+
+    Args:
+        output_file (string): the simulation output file
+        tier (string): one of TIERS
+        station (string): only rollups of this station, all if None
+        sep (string): seperator of the rollup file
+
+    Returns:
+        (generator of Rollup): in the order the windows closed
+    """
+    with open(rollup_file(output_file, tier)) as f:
+        for line in f:
+            rollup = report_line_to_rollup(line, sep)
+            if station is None or rollup.station == station:
+                yield rollup
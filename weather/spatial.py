@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+import math
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+BoundingBox = namedtuple('BoundingBox', ['min_latitude',
+                                         'min_longitude',
+                                         'max_latitude',
+                                         'max_longitude'])
+"""A latitude/longitude box in degrees.
+If min_longitude > max_longitude the box crosses the antimeridian."""
+
+
+Circle = namedtuple('Circle', ['latitude', 'longitude', 'radius_km'])
+"""All points within radius_km (great circle distance) of a centre"""
+
+
+def contains(region, latitude, longitude):
+    """Check whether a point lies within a region
+
+    Args:
+        region (BoundingBox or Circle)
+        latitude (double): degrees
+        longitude (double): degrees
+
+    Returns:
+        (bool)
+    """
+    if isinstance(region, Circle):
+        return distance_km(region.latitude, region.longitude,
+                           latitude, longitude) <= region.radius_km
+    if not region.min_latitude <= latitude <= region.max_latitude:
+        return False
+    if region.min_longitude <= region.max_longitude:
+        return region.min_longitude <= longitude <= region.max_longitude
+    return longitude >= region.min_longitude or longitude <= region.max_longitude
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great circle distance using the haversine formula
+
+    Args:
+        lat1, lon1 (double): first point in degrees
+        lat2, lon2 (double): second point in degrees
+
+    Returns:
+        (double): distance in km
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (math.sin(d_phi / 2) ** 2 +
+         math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(region):
+    """The smallest BoundingBox enclosing a region
+
+    Args:
+        region (BoundingBox or Circle)
+
+    Returns:
+        (BoundingBox)
+    """
+    if isinstance(region, BoundingBox):
+        return region
+    d_lat = math.degrees(region.radius_km / EARTH_RADIUS_KM)
+    min_lat = region.latitude - d_lat
+    max_lat = region.latitude + d_lat
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle covers a pole, so every longitude is in reach
+        return BoundingBox(max(min_lat, -90), -180, min(max_lat, 90), 180)
+    d_lon = math.degrees(math.asin(
+        min(1.0, math.sin(region.radius_km / EARTH_RADIUS_KM) /
+            math.cos(math.radians(region.latitude)))))
+    if d_lon >= 180:
+        return BoundingBox(min_lat, -180, max_lat, 180)
+    return BoundingBox(min_lat, wrap_longitude(region.longitude - d_lon),
+                       max_lat, wrap_longitude(region.longitude + d_lon))
+
+
+def wrap_longitude(longitude):
+    """Map a longitude into [-180, 180)"""
+    return (longitude + 180) % 360 - 180
+
+
+class GridIndex(object):
+    """A sparse uniform latitude/longitude grid over keyed points.
+    Region queries only visit the cells overlapping the region instead of
+    scanning every point.
+    """
+
+    def __init__(self, cell_size=1.0):
+        """
+        Args:
+            cell_size (double): width and height of a grid cell in degrees
+        """
+        self.cell_size = cell_size
+        self._cells = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, key, latitude, longitude):
+        """Add a point to the index
+
+        Args:
+            key (hashable): returned by queries matching the point
+            latitude (double): degrees
+            longitude (double): degrees
+        """
+        cell = (self._row(latitude), self._column(wrap_longitude(longitude)))
+        self._cells.setdefault(cell, []).append((key, latitude, longitude))
+        self._size += 1
+
+    def query(self, region):
+        """Find the keys of all points within a region
+
+        Args:
+            region (BoundingBox or Circle)
+
+        Returns:
+            (list): keys of the matching points, in no particular order
+        """
+        box = bounding_box(region)
+        rows = range(self._row(box.min_latitude),
+                     self._row(box.max_latitude) + 1)
+        min_lon = wrap_longitude(box.min_longitude)
+        max_lon = box.max_longitude
+        if max_lon != 180:
+            max_lon = wrap_longitude(max_lon)
+        if min_lon <= max_lon:
+            columns = list(range(self._column(min_lon),
+                                 self._column(max_lon) + 1))
+        else:
+            columns = (list(range(self._column(min_lon),
+                                  self._column(180) + 1)) +
+                       list(range(self._column(-180),
+                                  self._column(max_lon) + 1)))
+        if max_lon == 180 and self._column(-180) not in columns:
+            # insert files points at longitude 180 under -180
+            columns.append(self._column(-180))
+
+        if len(rows) * len(columns) > len(self._cells):
+            # A sparse grid: cheaper to walk the occupied cells
+            column_set = set(columns)
+            cells = [points for (row, column), points in self._cells.items()
+                     if row in rows and column in column_set]
+        else:
+            cells = [self._cells[(row, column)]
+                     for row in rows for column in columns
+                     if (row, column) in self._cells]
+
+        return [key
+                for points in cells
+                for key, latitude, longitude in points
+                if contains(region, latitude, longitude)]
+
+    def _row(self, latitude):
+        return int(math.floor(latitude / self.cell_size))
+
+    def _column(self, longitude):
+        return int(math.floor(longitude / self.cell_size))
+
+
+def index_records(records, cell_size=1.0):
+    """Build a GridIndex over station records, as read from the stations file
+
+    Args:
+        records (list(dict)): records with 'latitude' and 'longitude' fields
+        cell_size (double): grid cell size in degrees
+
+    Returns:
+        (GridIndex): keyed by the position of the record in records
+    """
+    index = GridIndex(cell_size)
+    for position, record in enumerate(records):
+        index.insert(position,
+                     float(record['latitude']),
+                     float(record['longitude']))
+    return index
+
+
+def parse_region(bbox=None, center=None, radius_km=None):
+    """Build a region from the comma separated configuration values
+
+    Args:
+        bbox (string): 'min_lat, min_lon, max_lat, max_lon'
+        center (string): 'lat, lon', requires radius_km
+        radius_km (string): radius around center
+
+    Returns:
+        (BoundingBox or Circle or None): None if no region is configured
+    """
+    if bbox:
+        return BoundingBox(*_parse_floats(bbox, 4, 'region_bbox'))
+    if center:
+        if not radius_km:
+            raise ValueError('region_center requires region_radius_km')
+        return Circle(*_parse_floats(center, 2, 'region_center'),
+                      radius_km=float(radius_km))
+    return None
+
+
+def _parse_floats(value, count, name):
+    values = [float(v) for v in value.split(',')]
+    if len(values) != count:
+        raise ValueError('{} expects {} comma separated values, got {!r}'
+                         .format(name, count, value))
+    return values
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class RingBuffer(object):
+    """A preallocated single producer, single consumer ring buffer.
+
+    The producer only ever advances the tail and the consumer the head, and
+    a slot is filled before the tail moves past it, so neither side takes a
+    lock. Both counters grow without bound; slots are taken modulo the
+    capacity.
+    """
+
+    _EMPTY = object()
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._head = 0
+        self._tail = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def try_put(self, value):
+        """Add value unless the buffer is full
+
+        Returns:
+            (bool): whether value was added
+        """
+        tail = self._tail
+        if tail - self._head >= self.capacity:
+            return False
+        self._slots[tail % self.capacity] = value
+        self._tail = tail + 1
+        return True
+
+    def try_get(self):
+        """Take the oldest value
+
+        Returns:
+            (tuple): (True, value), or (False, None) if the buffer is empty
+        """
+        head = self._head
+        if head == self._tail:
+            return False, None
+        i = head % self.capacity
+        value = self._slots[i]
+        self._slots[i] = None
+        self._head = head + 1
+        return True, value
+
+
+def backoff(attempt):
+    """Wait a little longer the more often a ring buffer was full or empty"""
+    time.sleep(0 if attempt < 16 else min(0.001 * (attempt - 15), 0.01))
+
+
+class ThreadedSubscriber(object):
+    """Feed published values through a RingBuffer to a consumer running
+    on its own thread, so the consumer overlaps with the simulation.
+
+    The publisher only waits when the buffer is full. Lag, the number of
+    published values the consumer has not processed yet, is tracked.
+    """
+
+    def __init__(self, consumer, capacity=65536, name=None):
+        """
+        Args:
+            consumer (function A -> None): called for every value,
+                on the subscriber's thread
+            capacity (int): size of the ring buffer
+            name (string): used for the thread and in metrics
+        """
+        self.consumer = consumer
+        self.name = name or getattr(consumer, '__name__', 'subscriber')
+        self._ring = RingBuffer(capacity)
+        self.published = 0
+        self.consumed = 0
+        self.max_lag = 0
+        self.producer_waits = 0
+        self._error = None
+        self._closing = False
+        self._thread = threading.Thread(target=self._drain,
+                                        name=self.name,
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def lag(self):
+        return self.published - self.consumed
+
+    def put(self, value):
+        """Publish a value, waiting while the ring buffer is full"""
+        if self._closing:
+            raise RuntimeError('{} is closed'.format(self.name))
+        attempt = 0
+        while not self._ring.try_put(value):
+            if self._error is not None:
+                raise self._error
+            self.producer_waits += 1
+            backoff(attempt)
+            attempt += 1
+        self.published += 1
+        lag = len(self._ring)
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+    def _drain(self):
+        attempt = 0
+        while True:
+            has_value, value = self._ring.try_get()
+            if not has_value:
+                if self._closing and not len(self._ring):
+                    return
+                backoff(attempt)
+                attempt += 1
+                continue
+            attempt = 0
+            try:
+                self.consumer(value)
+            except Exception as e:
+                self._error = e
+                return
+            self.consumed += 1
+
+    def close(self):
+        """Wait for the consumer to process every published value
+
+        Raises:
+            the exception raised by the consumer, if any
+        """
+        self._closing = True
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def metrics(self):
+        """
+        Returns:
+            (dict): published, consumed, current and max lag, and how often
+                the publisher had to wait for a full buffer
+        """
+        return {'name': self.name,
+                'published': self.published,
+                'consumed': self.consumed,
+                'lag': self.lag,
+                'max_lag': self.max_lag,
+                'producer_waits': self.producer_waits}